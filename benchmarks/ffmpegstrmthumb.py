@@ -0,0 +1,396 @@
+"""
+FFmpegStrm缩略图离线性能测试
+
+在临时目录生成指定数量strm文件的媒体库，由本地HTTP服务器提供测试视频，替换MoviePilot的app模块后直接加载插件，
+统计目录遍历耗时、每秒处理文件数、ffmpeg耗时和内存峰值，部署前用于发现性能回退。
+
+用法：
+    python benchmarks/ffmpegstrmthumb.py --files 5000 --generate 50 --threads 4
+    python benchmarks/ffmpegstrmthumb.py --files 20000 --generate 0 --json result.json
+
+需要安装插件依赖（apscheduler、pytz、watchdog），生成阶段需要ffmpeg和ffprobe
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+PLUGIN_FILE = Path(__file__).resolve().parent.parent / "plugins" / "ffmpegstrmthumb" / "__init__.py"
+
+logger = logging.getLogger("ffmpegstrmthumb-benchmark")
+
+
+def install_stubs(data_path: Path):
+    """
+    替换插件用到的MoviePilot模块
+    """
+
+    class Settings:
+        TZ = "Asia/Shanghai"
+        PLUGIN_DATA_PATH = data_path
+        VERSION_FLAG = "v2"
+
+    class SystemMessage:
+        @staticmethod
+        def put(message: str, title: str = None, **kwargs):
+            logger.warning(f"{title}：{message}")
+
+    class PluginBase:
+        def __init__(self):
+            self.systemmessage = SystemMessage()
+            self.chain = None
+            self._data: Dict[str, Any] = {}
+
+        def update_config(self, config: dict, plugin_id: str = None) -> bool:
+            return True
+
+        def get_data(self, key: str = None, plugin_id: str = None) -> Any:
+            return self._data.get(key)
+
+        def save_data(self, key: str, value: Any, plugin_id: str = None):
+            self._data[key] = value
+
+        def del_data(self, key: str, plugin_id: str = None):
+            self._data.pop(key, None)
+
+        def get_data_path(self, plugin_id: str = None) -> Path:
+            path = data_path / (plugin_id or self.__class__.__name__).lower()
+            path.mkdir(parents=True, exist_ok=True)
+            return path
+
+    class Namespace:
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    class EventManager:
+        @staticmethod
+        def register(*args, **kwargs):
+            return lambda func: func
+
+    class EventType:
+        PluginAction = "plugin.action"
+        TransferComplete = "transfer.complete"
+
+    class Enum:
+        def __getattr__(self, item):
+            return item
+
+    modules = {
+        "app": {},
+        "app.core": {},
+        "app.core.config": {"settings": Settings()},
+        "app.core.event": {"eventmanager": EventManager(), "Event": Namespace},
+        "app.log": {"logger": logging.getLogger("ffmpegstrmthumb")},
+        "app.plugins": {"_PluginBase": PluginBase},
+        "app.schemas": {"Notification": Namespace, "NotificationType": Enum(), "MessageChannel": Enum()},
+        "app.schemas.types": {"EventType": EventType},
+    }
+    for name, attrs in modules.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attrs)
+        module.__path__ = []
+        sys.modules[name] = module
+
+
+def load_plugin():
+    spec = importlib.util.spec_from_file_location("ffmpegstrmthumb", PLUGIN_FILE)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["ffmpegstrmthumb"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """
+    支持Range请求的静态文件服务，模拟strm远程地址
+    """
+    root: Path = None
+    latency: float = 0
+    bytes_sent = 0
+    requests = 0
+    lock = threading.Lock()
+
+    def do_HEAD(self):
+        self.__serve(False)
+
+    def do_GET(self):
+        self.__serve(True)
+
+    def __serve(self, body: bool):
+        path = self.root / self.path.lstrip("/").split("?")[0]
+        if not path.is_file():
+            self.send_error(404)
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        size = path.stat().st_size
+        start, end = 0, size - 1
+        match = re.match(r"bytes=(\d*)-(\d*)", self.headers.get("Range") or "")
+        if match:
+            if match.group(1):
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else end
+            elif match.group(2):
+                start = max(size - int(match.group(2)), 0)
+            end = min(end, size - 1)
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        with RangeHandler.lock:
+            RangeHandler.requests += 1
+        if not body:
+            return
+        with open(path, "rb") as file:
+            file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = file.read(min(remaining, 256 * 1024))
+                if not chunk:
+                    break
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    break
+                remaining -= len(chunk)
+                with RangeHandler.lock:
+                    RangeHandler.bytes_sent += len(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(root: Path, latency: float) -> ThreadingHTTPServer:
+    RangeHandler.root = root
+    RangeHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_video(path: Path, duration: int):
+    """
+    使用ffmpeg生成测试视频
+    """
+    subprocess.run(["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+                    "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=25:duration={duration}",
+                    "-c:v", "libx264", "-preset", "ultrafast", "-g", "250", "-pix_fmt", "yuv420p",
+                    "-movflags", "+faststart", "-y", str(path)], check=True)
+
+
+def make_library(root: Path, count: int, urls: List[str], per_dir: int = 12, per_show: int = 5):
+    """
+    生成剧集结构的strm媒体库：剧集/季/集
+    """
+    shutil.rmtree(root, ignore_errors=True)
+    for i in range(count):
+        season = i // per_dir
+        directory = root / f"Show {season // per_show:05d}" / f"Season {season % per_show + 1:02d}"
+        if i % per_dir == 0:
+            directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"S{season % per_show + 1:02d}E{i % per_dir + 1:02d}.strm").write_text(urls[i % len(urls)])
+
+
+def peak_rss() -> Dict[str, float]:
+    """
+    当前进程和已结束子进程（ffmpeg）的内存峰值，单位MB
+    """
+    return {
+        "self_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "children_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def percentile(values: List[float], percent: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(len(values) * percent / 100), len(values) - 1)], 3)
+
+
+def new_plugin(module, args, scan_path: Path, **config):
+    plugin = module.FFmpegStrmThumb()
+    plugin.init_plugin({
+        "scan_paths": str(scan_path),
+        "thread_count": args.threads,
+        "profile": args.profile,
+        "backend": args.backend,
+        "timeline": args.timeline,
+        # 测试时不限速
+        "rate_limit": "1000000=1000000",
+        "incremental": True,
+        **config
+    })
+    return plugin
+
+
+def bench_walk(module, args, work: Path) -> Dict[str, Any]:
+    """
+    目录遍历：首次建立索引、索引命中、不使用索引
+    """
+    library = work / "walk"
+    make_library(library, args.files, ["http://127.0.0.1/video.mp4"])
+    plugin = new_plugin(module, args, library)
+    walker = getattr(plugin, "_FFmpegStrmThumb__list_strm_files")
+    exclude = module.ExcludeMatcher([])
+    result = {}
+    for name, incremental in (("cold", True), ("warm", True), ("no_index", False)):
+        plugin._incremental = incremental
+        start = time.perf_counter()
+        count = sum(1 for _ in walker(library, False, exclude))
+        elapsed = time.perf_counter() - start
+        result[name] = {
+            "files": count,
+            "seconds": round(elapsed, 3),
+            "files_per_sec": round(count / elapsed, 1) if elapsed else None,
+        }
+    plugin.stop_service()
+    result["rss"] = peak_rss()
+    return result
+
+
+def bench_generate(module, args, work: Path, base_url: str) -> Dict[str, Any]:
+    """
+    缩略图生成：覆盖生成整个测试库，再逐个调用gen_file_thumb
+    """
+    library = work / "generate"
+    urls = [f"{base_url}/video{i}.mp4" for i in range(args.videos)]
+    make_library(library, args.generate, urls)
+    plugin = new_plugin(module, args, library)
+    execute = plugin.execute
+    durations: List[float] = []
+    lock = threading.Lock()
+
+    def timed_execute(cmd, timeout=None):
+        start = time.perf_counter()
+        try:
+            return execute(cmd, timeout=timeout)
+        finally:
+            # 只统计截图，不统计ffprobe
+            if cmd and cmd[0] == "ffmpeg":
+                with lock:
+                    durations.append(time.perf_counter() - start)
+
+    plugin.execute = timed_execute
+    start = time.perf_counter()
+    getattr(plugin, "_FFmpegStrmThumb__libraryscan")(True)
+    elapsed = time.perf_counter() - start
+    generated = sum(1 for _ in library.rglob("*-thumb.*"))
+    scan_ffmpeg = list(durations)
+
+    # 单个文件处理延迟
+    latencies = []
+    for strm in sorted(library.rglob("*.strm"))[:args.samples]:
+        file_start = time.perf_counter()
+        plugin.gen_file_thumb(strm, True)
+        latencies.append(time.perf_counter() - file_start)
+    plugin.stop_service()
+    return {
+        "libraryscan": {
+            "files": args.generate,
+            "generated": generated,
+            "seconds": round(elapsed, 3),
+            "files_per_sec": round(generated / elapsed, 2) if elapsed else None,
+            "ffmpeg_calls": len(scan_ffmpeg),
+            "ffmpeg_seconds": round(sum(scan_ffmpeg), 3),
+            "ffmpeg_p50": percentile(scan_ffmpeg, 50),
+            "ffmpeg_p95": percentile(scan_ffmpeg, 95),
+        },
+        "gen_file_thumb": {
+            "files": len(latencies),
+            "mean": round(statistics.mean(latencies), 3) if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+        },
+        "http": {
+            "requests": RangeHandler.requests,
+            "mb_sent": round(RangeHandler.bytes_sent / 1024 / 1024, 2),
+        },
+        "rss": peak_rss(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FFmpegStrm缩略图离线性能测试")
+    parser.add_argument("--files", type=int, default=5000, help="目录遍历测试的strm文件数量")
+    parser.add_argument("--generate", type=int, default=30, help="生成缩略图测试的strm文件数量，0为跳过")
+    parser.add_argument("--samples", type=int, default=5, help="单独测试gen_file_thumb的文件数量")
+    parser.add_argument("--threads", type=int, default=2, help="并发数量")
+    parser.add_argument("--profile", default="balanced", help="截图方案：quality、balanced、fast")
+    parser.add_argument("--backend", default="ffmpeg", help="截图后端：ffmpeg、pyav")
+    parser.add_argument("--timeline", default="00:03:01", help="截取时间")
+    parser.add_argument("--videos", type=int, default=3, help="测试视频数量，strm文件轮流指向")
+    parser.add_argument("--duration", type=int, default=240, help="生成的测试视频时长，秒")
+    parser.add_argument("--video", help="使用已有的视频文件代替生成")
+    parser.add_argument("--latency", type=float, default=0, help="HTTP服务器每个请求的延迟，秒")
+    parser.add_argument("--workdir", help="工作目录，默认使用临时目录并在结束后删除")
+    parser.add_argument("--json", help="结果输出到JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="输出插件日志")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(threadName)s %(levelname)s %(message)s")
+    work = Path(args.workdir or tempfile.mkdtemp(prefix="ffmpegstrmthumb-bench-"))
+    work.mkdir(parents=True, exist_ok=True)
+    install_stubs(work / "data")
+    module = load_plugin()
+    results: Dict[str, Any] = {"args": vars(args)}
+    try:
+        print(f"遍历测试：{args.files}个strm文件 ...")
+        results["walk"] = bench_walk(module, args, work)
+        if args.generate > 0:
+            if not shutil.which("ffmpeg") and (args.backend != "pyav" or not args.video):
+                print("未找到ffmpeg，跳过生成测试")
+            else:
+                videos = work / "videos"
+                videos.mkdir(exist_ok=True)
+                source = Path(args.video) if args.video else videos / "source.mp4"
+                if not args.video and not source.exists():
+                    print(f"生成{args.duration}秒测试视频 ...")
+                    make_video(source, args.duration)
+                for i in range(args.videos):
+                    target = videos / f"video{i}.mp4"
+                    if not target.exists():
+                        shutil.copyfile(source, target)
+                server = start_server(videos, args.latency)
+                try:
+                    print(f"生成测试：{args.generate}个strm文件，并发{args.threads}，方案{args.profile}，后端{args.backend} ...")
+                    results["generate"] = bench_generate(
+                        module, args, work, f"http://127.0.0.1:{server.server_address[1]}")
+                finally:
+                    server.shutdown()
+    finally:
+        if not args.workdir:
+            shutil.rmtree(work, ignore_errors=True)
+
+    print(json.dumps({k: v for k, v in results.items() if k != "args"}, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,1582 @@
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import shlex
+import shutil
+import signal
+import sqlite3
 import subprocess
+import tempfile
 import threading
 import time
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
 from pathlib import Path
 from threading import Event as ThreadEvent
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional, Iterator, Callable, Set
+from urllib.parse import urlparse, quote
 
 import pytz
+import requests
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from watchdog.events import FileSystemEventHandler, FileSystemEvent
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
+from requests.adapters import HTTPAdapter
 
 from app.core.config import settings
+from app.core.event import eventmanager, Event
 from app.log import logger
 from app.plugins import _PluginBase
-from app.utils.system import SystemUtils
 from app.schemas import Notification, NotificationType, MessageChannel
+from app.schemas.types import EventType
 
-ffmpeg_lock = threading.Lock()
+try:
+    import av
+except ImportError:
+    av = None
+
+
+# ffmpeg截图方案：input为-i之前的解码参数，width为默认输出宽度（None为原始分辨率），qscale为jpg质量
+FFMPEG_PROFILES = {
+    # 精确定位到截取时间，输出原始分辨率
+    "quality": {
+        "name": "画质优先",
+        "input": [],
+        "width": None,
+        "qscale": 2,
+    },
+    # 定位到截取时间前的关键帧，缩放到1280宽
+    "balanced": {
+        "name": "均衡",
+        "input": ["-noaccurate_seek"],
+        "width": 1280,
+        "qscale": 3,
+    },
+    # 只解码关键帧，缩放到640宽，读取的数据最少
+    "fast": {
+        "name": "速度优先",
+        "input": ["-skip_frame", "nokey", "-noaccurate_seek"],
+        "width": 640,
+        "qscale": 5,
+    },
+}
+
+# 截取时间相差不超过该秒数的输出共用一次定位，相差更远时各自定位，避免解码中间的整段视频
+THUMB_MERGE_WINDOW = 30
+
+# 截图后端
+THUMB_BACKENDS = {
+    "ffmpeg": "ffmpeg命令",
+    "pyav": "PyAV进程内解码",
+}
+
+# 缩略图格式：扩展名、编码器
+THUMB_FORMATS = {
+    "jpg": {"name": "JPEG", "codec": "mjpeg"},
+    "webp": {"name": "WebP", "codec": "libwebp"},
+}
+
+
+class ThumbIndex:
+    """
+    扫描索引，记录目录和strm文件的修改时间、大小、strm目标及缩略图状态，用于增量扫描
+    """
+    # 缩略图状态
+    STATE_PENDING = "pending"
+    STATE_DONE = "done"
+    STATE_FAILED = "failed"
+
+    def __init__(self, db_path: Path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS dirs ("
+                               "path TEXT PRIMARY KEY, mtime REAL, subdirs TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS files ("
+                               "path TEXT PRIMARY KEY, dir TEXT, mtime REAL, size INTEGER, "
+                               "target TEXT, state TEXT, updated REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_dir ON files (dir)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS probes ("
+                               "target TEXT PRIMARY KEY, duration REAL, updated REAL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS checkpoints (dir TEXT PRIMARY KEY)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS failures ("
+                               "path TEXT PRIMARY KEY, target TEXT, count INTEGER, next_retry REAL, "
+                               "error TEXT, updated REAL)")
+            self._conn.commit()
+
+    def get_dir(self, path: str) -> Optional[Tuple[float, List[str]]]:
+        """
+        查询目录的修改时间和子目录列表
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT mtime, subdirs FROM dirs WHERE path = ?", (path,)).fetchone()
+        if not row:
+            return None
+        return row[0], json.loads(row[1] or "[]")
+
+    def get_files(self, directory: str) -> Dict[str, Tuple[float, int, str]]:
+        """
+        查询目录下已记录的文件：{文件路径: (修改时间, 大小, 状态)}
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT path, mtime, size, state FROM files WHERE dir = ?",
+                                      (directory,)).fetchall()
+        return {row[0]: (row[1], row[2], row[3]) for row in rows}
+
+    def update_dir(self, path: str, mtime: float, subdirs: List[str],
+                   files: List[Tuple[str, float, int]]):
+        """
+        更新目录记录，新增或变化的文件重置为待处理，并清理已删除的文件和子目录
+        """
+        with self._lock:
+            old = self._conn.execute("SELECT subdirs FROM dirs WHERE path = ?", (path,)).fetchone()
+            for name in set(json.loads(old[0] or "[]") if old else []) - set(subdirs):
+                removed = str(Path(path) / name)
+                prefix = removed + "/"
+                self._conn.execute("DELETE FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?",
+                                   (removed, len(prefix), prefix))
+                self._conn.execute("DELETE FROM files WHERE dir = ? OR substr(dir, 1, ?) = ?",
+                                   (removed, len(prefix), prefix))
+            self._conn.execute("INSERT OR REPLACE INTO dirs (path, mtime, subdirs) VALUES (?, ?, ?)",
+                               (path, mtime, json.dumps(subdirs, ensure_ascii=False)))
+            known = {row[0] for row in self._conn.execute("SELECT path FROM files WHERE dir = ?", (path,))}
+            for file_path, file_mtime, file_size in files:
+                known.discard(file_path)
+                self._conn.execute("INSERT INTO files (path, dir, mtime, size, state, updated) "
+                                   "VALUES (?, ?, ?, ?, ?, ?) "
+                                   "ON CONFLICT(path) DO UPDATE SET state = excluded.state, "
+                                   "mtime = excluded.mtime, size = excluded.size, updated = excluded.updated "
+                                   "WHERE files.mtime != excluded.mtime OR files.size != excluded.size",
+                                   (file_path, path, file_mtime, file_size, self.STATE_PENDING, time.time()))
+            for file_path in known:
+                self._conn.execute("DELETE FROM files WHERE path = ?", (file_path,))
+            self._conn.commit()
+
+    def set_state(self, path: str, state: str, target: str = None):
+        """
+        更新文件的缩略图状态和strm目标
+        """
+        with self._lock:
+            self._conn.execute("UPDATE files SET state = ?, target = COALESCE(?, target), updated = ? "
+                               "WHERE path = ?", (state, target, time.time(), path))
+            self._conn.commit()
+
+    def reset_done(self) -> int:
+        """
+        将已完成的文件重置为待处理，下次扫描时重新检查图片是否存在，返回重置的数量
+        """
+        with self._lock:
+            cursor = self._conn.execute("UPDATE files SET state = ?, updated = ? WHERE state = ?",
+                                        (self.STATE_PENDING, time.time(), self.STATE_DONE))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def get_duration(self, target: str) -> Optional[float]:
+        """
+        查询strm目标缓存的视频时长
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT duration FROM probes WHERE target = ?", (target,)).fetchone()
+        return row[0] if row else None
+
+    def set_duration(self, target: str, duration: float):
+        """
+        缓存strm目标的视频时长
+        """
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO probes (target, duration, updated) VALUES (?, ?, ?)",
+                               (target, duration, time.time()))
+            self._conn.commit()
+
+    def get_failure(self, path: str) -> Optional[Tuple[str, int, float]]:
+        """
+        查询文件的失败记录：(strm目标, 失败次数, 下次重试时间)
+        """
+        with self._lock:
+            return self._conn.execute("SELECT target, count, next_retry FROM failures WHERE path = ?",
+                                      (path,)).fetchone()
+
+    def add_failure(self, path: str, target: str, error: str, base: float, limit: float) -> Tuple[int, float]:
+        """
+        记录一次失败，重试间隔按失败次数指数增长，strm目标变化时重新计数
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT target, count FROM failures WHERE path = ?", (path,)).fetchone()
+            count = row[1] + 1 if row and row[0] == target else 1
+            next_retry = time.time() + min(base * 2 ** (count - 1), limit)
+            self._conn.execute("INSERT OR REPLACE INTO failures (path, target, count, next_retry, error, updated) "
+                               "VALUES (?, ?, ?, ?, ?, ?)", (path, target, count, next_retry, error, time.time()))
+            self._conn.commit()
+        return count, next_retry
+
+    def list_failures(self, limit: int = 100) -> List[dict]:
+        """
+        查询最近的失败记录
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT path, target, count, next_retry, error, updated FROM failures "
+                                      "ORDER BY updated DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(zip(("path", "target", "count", "next_retry", "error", "updated"), row)) for row in rows]
+
+    def get_failure_retries(self) -> Dict[str, float]:
+        """
+        查询所有失败记录的下次重试时间
+        """
+        with self._lock:
+            return dict(self._conn.execute("SELECT path, next_retry FROM failures").fetchall())
+
+    def count_failures(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM failures").fetchone()[0]
+
+    def clear_failures(self, path: str = None) -> int:
+        """
+        清除失败记录，不指定路径时清除全部，返回清除的数量
+        """
+        with self._lock:
+            if path:
+                prefix = path.rstrip("/") + "/"
+                cursor = self._conn.execute("DELETE FROM failures WHERE path = ? OR substr(path, 1, ?) = ?",
+                                            (path, len(prefix), prefix))
+            else:
+                cursor = self._conn.execute("DELETE FROM failures")
+            self._conn.commit()
+            return cursor.rowcount
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: Optional[str]):
+        with self._lock:
+            if value is None:
+                self._conn.execute("DELETE FROM meta WHERE key = ?", (key,))
+            else:
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self._conn.commit()
+
+    def get_checkpoints(self) -> Set[str]:
+        """
+        查询扫描断点中已完成的目录
+        """
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT dir FROM checkpoints")}
+
+    def add_checkpoint(self, directory: str):
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO checkpoints (dir) VALUES (?)", (directory,))
+            self._conn.commit()
+
+    def clear_checkpoints(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ExcludeMatcher:
+    """
+    排除路径匹配器，绝对路径构建为前缀树，通配符和相对路径编译为正则
+    不含/的规则只匹配文件或目录名称，如 *.sample.strm、Extras
+    通配符*和?不匹配/，**匹配任意层级；含/的相对路径匹配路径的末尾部分，如 Season */Extras
+    """
+    # 前缀树中标记排除路径结尾的键
+    _END = "\0"
+
+    def __init__(self, exclude_paths: List[str]):
+        self._trie: Dict[str, dict] = {}
+        self._exact: Set[str] = set()
+        self._path_patterns: List[re.Pattern] = []
+        self._name_patterns: List[re.Pattern] = []
+        for exclude_path in exclude_paths:
+            exclude_path = exclude_path.strip()
+            if not exclude_path:
+                continue
+            if not exclude_path.startswith("/") or any(char in exclude_path for char in "*?["):
+                pattern = self.__compile(exclude_path.rstrip("/"))
+                if "/" in exclude_path:
+                    self._path_patterns.append(pattern)
+                else:
+                    self._name_patterns.append(pattern)
+                continue
+            node = self._trie
+            for part in Path(exclude_path).parts:
+                node = node.setdefault(part, {})
+            node[self._END] = {}
+            self._exact.add(str(Path(exclude_path)))
+
+    @staticmethod
+    def __compile(pattern: str) -> re.Pattern:
+        """
+        将通配符转换为正则，与fnmatch不同，*和?不跨越目录
+        """
+        regex = [] if pattern.startswith("/") else ["(?:.*/)?"]
+        i = 0
+        while i < len(pattern):
+            if pattern.startswith("**", i):
+                regex.append(".*")
+                i += 2
+                continue
+            char = pattern[i]
+            end = pattern.find("]", i + 2) if char == "[" else -1
+            if char == "*":
+                regex.append("[^/]*")
+            elif char == "?":
+                regex.append("[^/]")
+            elif end != -1:
+                body = pattern[i + 1:end].replace("\\", "\\\\")
+                regex.append(f"[^{body[1:]}]" if body.startswith("!") else f"[{body}]")
+                i = end
+            else:
+                regex.append(re.escape(char))
+            i += 1
+        return re.compile("".join(regex) + r"\Z")
+
+    def __bool__(self):
+        return bool(self._trie or self._path_patterns or self._name_patterns)
+
+    def match(self, path: Path) -> bool:
+        """
+        判断路径或其上级目录是否被排除
+        """
+        node = self._trie
+        for part in path.parts:
+            node = node.get(part)
+            if node is None:
+                break
+            if self._END in node:
+                return True
+        if self._name_patterns and any(pattern.match(part) for part in path.parts
+                                       for pattern in self._name_patterns):
+            return True
+        if self._path_patterns:
+            for parent in (path, *path.parents):
+                if any(pattern.match(str(parent)) for pattern in self._path_patterns):
+                    return True
+        return False
+
+    def match_file(self, path: Path) -> bool:
+        """
+        判断所在目录已检查过的文件是否被排除，只匹配文件本身，不再检查上级目录
+        """
+        if str(path) in self._exact:
+            return True
+        if any(pattern.match(path.name) for pattern in self._name_patterns):
+            return True
+        return any(pattern.match(str(path)) for pattern in self._path_patterns)
+
+
+class TokenBucket:
+    """
+    令牌桶，按固定速率补充令牌，桶容量即允许的突发数量
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        # 每秒补充的令牌数
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # 已放行的任务数
+        self.acquired = 0
+        # 累计等待时间
+        self.waited = 0.0
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """
+        预占一个令牌，返回需要等待的秒数
+        """
+        self.refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+
+class HostRateLimiter:
+    """
+    按strm目标主机分别限速，一个主机限速时不影响其它主机和本地文件
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self._rate = rate_per_minute / 60
+        self._burst = max(burst, 1)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def estimate(self, count: int) -> float:
+        """
+        一个主机放行count个请求至少需要的秒数
+        """
+        if self._rate <= 0:
+            return 0
+        return max(count - self._burst, 0) / self._rate
+
+    def reserve(self, host: str) -> float:
+        """
+        预占主机的一个令牌，返回需要等待的秒数，不阻塞当前线程，由调用方暂缓任务
+        """
+        if not host or self._rate <= 0:
+            return 0
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if not bucket:
+                bucket = self._buckets[host] = TokenBucket(self._rate, self._burst)
+            wait = bucket.reserve()
+            bucket.acquired += 1
+            bucket.waited += wait
+        if wait > 0:
+            logger.debug(f"{host} 触发限速，{wait:.1f}秒后处理...")
+        return wait
+
+    def snapshot(self) -> List[dict]:
+        """
+        各主机的限速状态
+        """
+        with self._lock:
+            states = []
+            for host, bucket in self._buckets.items():
+                bucket.refill()
+                states.append({
+                    "host": host,
+                    "tokens": round(bucket.tokens, 2),
+                    "capacity": bucket.capacity,
+                    # 已预占令牌但还未到处理时间的任务数
+                    "waiting": max(-math.floor(bucket.tokens), 0),
+                    "acquired": bucket.acquired,
+                    "waited": round(bucket.waited, 1),
+                })
+        return sorted(states, key=lambda x: x["host"])
+
+
+class HostConcurrency:
+    """
+    按strm目标主机限制同时运行的任务数
+    达到上限的主机的任务先暂存，由释放并发的线程接着处理，不占用其它主机的工作线程
+    暂存任务不会阻塞工作线程，扫描时由ThumbQueue按暂存数量限制遍历速度
+    """
+
+    def __init__(self, limits: Dict[str, int], default: int = 0):
+        # 主机并发上限，0表示不限制
+        self._limits = limits
+        self._default = default
+        self._running: Dict[str, int] = {}
+        self._parked: Dict[str, deque] = {}
+        self._parked_count = 0
+        self._lock = threading.Lock()
+
+    def limit(self, host: str) -> int:
+        if not host:
+            return 0
+        return self._limits.get(host, self._default)
+
+    def acquire(self, host: str, task: Any) -> bool:
+        """
+        获取主机的并发名额，返回True时由调用方处理任务
+        达到上限时任务暂存等待其它线程处理并返回False
+        """
+        limit = self.limit(host)
+        with self._lock:
+            running = self._running.get(host, 0)
+            if not limit or running < limit:
+                self._running[host] = running + 1
+                return True
+            self._parked.setdefault(host, deque()).append(task)
+            self._parked_count += 1
+            return False
+
+    def release(self, host: str) -> Optional[Any]:
+        """
+        释放主机的并发名额，有暂存任务时直接返回该任务并保留名额
+        """
+        with self._lock:
+            parked = self._parked.get(host)
+            if parked:
+                self._parked_count -= 1
+                return parked.popleft()
+            self._running[host] = self._running.get(host, 1) - 1
+            return None
+
+    def parked(self) -> int:
+        """
+        所有主机暂存的任务数
+        """
+        return self._parked_count
+
+    def clear(self):
+        """
+        丢弃暂存的任务
+        """
+        with self._lock:
+            self._parked.clear()
+            self._parked_count = 0
+
+    def snapshot(self) -> Dict[str, dict]:
+        """
+        各主机的并发状态
+        """
+        with self._lock:
+            return {
+                host: {
+                    "limit": self.limit(host),
+                    "running": self._running.get(host, 0),
+                    "parked": len(self._parked.get(host) or []),
+                } for host in set(self._running) | set(self._parked) if host
+            }
+
+
+class LoadGovernor:
+    """
+    负载调节，按系统负载、网络流量和暂停时段调整同时运行的ffmpeg数量
+    负载或流量超过阈值时并发减半，超过两倍时暂停，低于阈值的70%时逐个恢复
+    """
+    # 采样间隔（秒）
+    INTERVAL = 10
+
+    def __init__(self, max_workers: int, load_limit: Optional[float] = None, net_limit: Optional[float] = None,
+                 pause_hours: List[Tuple[int, int]] = None):
+        self._max = max_workers
+        self._allowed = max_workers
+        self._running = 0
+        # 每个CPU核心的1分钟平均负载
+        self._load_limit = load_limit
+        # 网络流量阈值，Mbps换算为字节/秒
+        self._net_limit = net_limit * 125000 if net_limit else None
+        # 暂停时段：[(开始分钟, 结束分钟)]
+        self._pause_hours = pause_hours or []
+        self._cond = threading.Condition()
+        self._sampled = 0.0
+        self._net_sample: Optional[Tuple[float, int]] = None
+        self.load: Optional[float] = None
+        self.net: Optional[float] = None
+        self.reason = ""
+
+    @staticmethod
+    def parse_hours(text: str) -> List[Tuple[int, int]]:
+        """
+        解析暂停时段，如 19:00-23:30，多个时段用逗号或换行分隔
+        """
+        hours = []
+        for item in re.split(r"[,，\n]", text or ""):
+            item = item.strip()
+            if not item:
+                continue
+            try:
+                start, end = [datetime.strptime(part.strip(), "%H:%M") for part in item.split("-")]
+                hours.append((start.hour * 60 + start.minute, end.hour * 60 + end.minute))
+            except ValueError:
+                logger.error(f"FFmpegStrm缩略图暂停时段配置错误：{item}")
+        return hours
+
+    def acquire(self, stop_event: ThreadEvent) -> bool:
+        """
+        等待可用的并发，服务停止时返回False
+        """
+        with self._cond:
+            while True:
+                self.__update()
+                if self._running < self._allowed:
+                    self._running += 1
+                    return True
+                if stop_event.is_set():
+                    return False
+                self._cond.wait(timeout=1)
+
+    def release(self):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    def __update(self):
+        now = time.monotonic()
+        if now - self._sampled < self.INTERVAL:
+            return
+        self._sampled = now
+        if self.__in_pause_hours():
+            self._allowed = 0
+            self.reason = "暂停时段"
+            return
+        ratio = 0.0
+        self.load = self.__read_load()
+        if self._load_limit and self.load is not None:
+            ratio = max(ratio, self.load / self._load_limit)
+        self.net = self.__read_net(now)
+        if self._net_limit and self.net is not None:
+            ratio = max(ratio, self.net / self._net_limit)
+        if ratio >= 2:
+            self._allowed = 0
+            self.reason = "负载过高，暂停生成"
+        elif ratio >= 1:
+            self._allowed = max(self._allowed // 2, 1)
+            self.reason = "负载较高，降低并发"
+        elif self._allowed == 0:
+            # 负载低于阈值或离开暂停时段后至少恢复一个并发
+            self._allowed = 1
+            self.reason = "恢复生成，逐步提高并发" if self._allowed < self._max else ""
+        elif ratio < 0.7 and self._allowed < self._max:
+            self._allowed += 1
+            self.reason = "负载降低，恢复并发" if self._allowed < self._max else ""
+        elif self._allowed >= self._max:
+            self.reason = ""
+        self._cond.notify_all()
+
+    def __in_pause_hours(self) -> bool:
+        now = datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end in self._pause_hours:
+            if start <= end:
+                if start <= minute < end:
+                    return True
+            elif minute >= start or minute < end:
+                return True
+        return False
+
+    @staticmethod
+    def __read_load() -> Optional[float]:
+        try:
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+        except OSError:
+            return None
+
+    def __read_net(self, now: float) -> Optional[float]:
+        """
+        所有非回环网卡的收发速率，字节/秒
+        """
+        try:
+            with open("/proc/net/dev", "r") as file:
+                lines = file.readlines()[2:]
+        except OSError:
+            return None
+        total = 0
+        for line in lines:
+            name, _, data = line.partition(":")
+            if name.strip() == "lo":
+                continue
+            fields = data.split()
+            if len(fields) >= 9:
+                total += int(fields[0]) + int(fields[8])
+        last, self._net_sample = self._net_sample, (now, total)
+        if not last or now <= last[0]:
+            return None
+        return max(total - last[1], 0) / (now - last[0])
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "allowed": self._allowed,
+                "max": self._max,
+                "running": self._running,
+                "load": round(self.load, 2) if self.load is not None else None,
+                "net_mbps": round(self.net / 125000, 1) if self.net is not None else None,
+                "reason": self.reason,
+            }
+
+
+class RangeUnsupported(IOError):
+    """
+    远程地址不支持Range请求
+    """
+    pass
+
+
+def fetch_range(session: requests.Session, url: str, start: int, length: int, deadline: float,
+                stop_event: ThreadEvent) -> Tuple[bytes, Optional[int], str, Optional[str]]:
+    """
+    请求远程地址的一段数据，流式读取且最多读取length字节，返回数据、文件大小、跳转后的地址和文件版本
+    文件版本为ETag或Last-Modified，用于判断远程文件是否已被替换
+    远程地址不支持Range请求时不读取响应内容，直接关闭连接
+    """
+    remaining = deadline - time.monotonic()
+    if stop_event.is_set() or remaining <= 0:
+        raise TimeoutError("读取超时或服务停止")
+    response = session.get(url, headers={"Range": f"bytes={start}-{start + length - 1}"}, stream=True,
+                           timeout=(min(remaining, 10), min(remaining, 30)))
+    with response:
+        validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+        if response.status_code == 416:
+            return b"", None, response.url, validator
+        if response.status_code != 206:
+            raise RangeUnsupported(f"不支持Range请求，状态码 {response.status_code}")
+        size = None
+        content_range = response.headers.get("Content-Range") or ""
+        if "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+            size = int(content_range.rsplit("/", 1)[1])
+        chunks = []
+        received = 0
+        for chunk in response.iter_content(64 * 1024):
+            if stop_event.is_set() or time.monotonic() > deadline:
+                raise TimeoutError("读取超时或服务停止")
+            chunks.append(chunk[:max(length - received, 0)])
+            received += len(chunk)
+            # 返回超出请求范围的数据时不再读取，关闭连接
+            if received > length:
+                break
+        return b"".join(chunks), size, response.url, validator
+
+
+class HttpRangeReader:
+    """
+    通过HTTP Range请求分块读取远程视频，复用主机的连接池，供PyAV在进程内解码
+    """
+    # 每次请求读取的最小字节数
+    BLOCK_SIZE = 512 * 1024
+
+    def __init__(self, session: requests.Session, url: str, deadline: float, stop_event: ThreadEvent):
+        self._session = session
+        self._url = url
+        self._deadline = deadline
+        self._stop_event = stop_event
+        self._pos = 0
+        self._size: Optional[int] = None
+        self._buffer = b""
+        self._buffer_start = 0
+
+    def __fetch(self, start: int, length: int) -> bytes:
+        data, size, url, _ = fetch_range(self._session, self._url, start, length, self._deadline,
+                                         self._stop_event)
+        # 跳转后的地址直接使用，避免每次请求都重新跳转
+        self._url = url
+        if size is not None:
+            self._size = size
+        return data
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.BLOCK_SIZE
+        offset = self._pos - self._buffer_start
+        if offset < 0 or offset + size > len(self._buffer):
+            if self._size is not None and self._pos >= self._size:
+                return b""
+            self._buffer = self.__fetch(self._pos, max(size, self.BLOCK_SIZE))
+            self._buffer_start = self._pos
+            offset = 0
+        data = self._buffer[offset:offset + size]
+        self._pos += len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_END:
+            if self._size is None:
+                self.__fetch(0, 1)
+            self._pos = self._size + offset
+        elif whence == os.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = offset
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    @staticmethod
+    def seekable() -> bool:
+        return True
+
+
+class RangeCache:
+    """
+    strm远程地址的本地Range缓存代理，按固定大小的数据块缓存读取过的内容，超过容量时淘汰最久未使用的数据块
+    ffmpeg、ffprobe和PyAV通过本地地址读取，重复探测、覆盖生成和多张截图不再重复请求远程地址
+    """
+    # 数据块大小
+    BLOCK_SIZE = 1024 * 1024
+    # 最多记录的本地代理地址数量
+    MAX_TARGETS = 10000
+    # 重新确认远程文件未被替换的间隔秒数
+    VALIDATE_INTERVAL = 600
+
+    def __init__(self, cache_path: Path, max_size: int, get_session: Callable[[str], requests.Session],
+                 timeout: int):
+        self._path = cache_path
+        self._max_size = max_size
+        self._get_session = get_session
+        self._timeout = timeout
+        self._stop_event = ThreadEvent()
+        self._lock = threading.Lock()
+        # 数据块路径 -> 大小，按最近使用排序
+        self._blocks: OrderedDict[str, int] = OrderedDict()
+        self._total = 0
+        # 地址标识 -> 已缓存的数据块数量
+        self._counts: Dict[str, int] = {}
+        # 地址标识 -> 远程地址，按最近使用排序
+        self._targets: OrderedDict[str, str] = OrderedDict()
+        # 地址标识 -> 文件大小和文件版本
+        self._sizes: Dict[str, Tuple[int, Optional[str]]] = {}
+        # 地址标识 -> 最近一次确认文件未被替换的时间
+        self._validated: Dict[str, float] = {}
+        # 不支持Range请求的地址标识，直接跳转
+        self._direct: Set[str] = set()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self.hits = 0
+        self.misses = 0
+        self.__load()
+
+    @staticmethod
+    def key(target: str) -> str:
+        return ThumbCache.key("range", target)
+
+    def __load(self):
+        """
+        加载已缓存的数据块，按修改时间恢复使用顺序
+        """
+        blocks = []
+        if self._path.exists():
+            for directory in os.scandir(self._path):
+                if not directory.is_dir():
+                    continue
+                for entry in os.scandir(directory.path):
+                    if entry.name.isdigit():
+                        stat = entry.stat()
+                        blocks.append((stat.st_mtime, directory.name, entry.path, stat.st_size))
+                    elif entry.name == "direct":
+                        self._direct.add(directory.name)
+        with self._lock:
+            for _, key, path, size in sorted(blocks):
+                self._blocks[path] = size
+                self._counts[key] = self._counts.get(key, 0) + 1
+                self._total += size
+            self.__evict()
+
+    def start(self):
+        """
+        在本地随机端口启动代理服务
+        """
+        self._stop_event.clear()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), RangeCacheHandler)
+        self._server.daemon_threads = True
+        self._server.cache = self
+        threading.Thread(target=self._server.serve_forever, name="FFmpegStrmThumbRangeCache",
+                         daemon=True).start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def url(self, target: str) -> str:
+        """
+        远程地址对应的本地代理地址，保留文件名便于ffmpeg识别格式
+        """
+        key = self.key(target)
+        with self._lock:
+            self._targets[key] = target
+            self._targets.move_to_end(key)
+            while len(self._targets) > self.MAX_TARGETS:
+                self._validated.pop(self._targets.popitem(last=False)[0], None)
+        name = quote(Path(urlparse(target).path).name or "video")
+        return f"http://127.0.0.1:{self._server.server_address[1]}/{key}/{name}"
+
+    def target(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._targets.get(key)
+
+    def is_direct(self, target: str) -> bool:
+        with self._lock:
+            return self.key(target) in self._direct
+
+    def size(self, target: str, position: int = 0) -> int:
+        """
+        获取远程文件大小，未知时读取所在位置的数据块
+        超过确认间隔时请求1字节重新确认文件大小和版本，远程文件已被替换时丢弃缓存的数据块
+        """
+        key = self.key(target)
+        with self._lock:
+            meta = self._sizes.get(key)
+            validated = self._validated.get(key, 0)
+        if meta is None:
+            try:
+                meta = json.loads((self._path / key / "size").read_text())
+                # 旧版本只记录了文件大小
+                meta = (meta, None) if isinstance(meta, int) else (int(meta["size"]), meta.get("validator"))
+                with self._lock:
+                    self._sizes.setdefault(key, meta)
+            except (OSError, ValueError, TypeError, KeyError):
+                pass
+        if meta is None:
+            self.block(target, position // self.BLOCK_SIZE)
+        elif time.monotonic() - validated > self.VALIDATE_INTERVAL:
+            self.__fetch(target, key, 0, 1)
+        with self._lock:
+            meta = self._sizes.get(key)
+        if meta is None:
+            raise IOError("未获取到文件大小")
+        return meta[0]
+
+    def block(self, target: str, index: int) -> bytes:
+        """
+        读取数据块，优先使用缓存，没有缓存时请求远程地址并缓存
+        """
+        key = self.key(target)
+        path = self._path / key / str(index)
+        with self._lock:
+            cached = str(path) in self._blocks
+            if cached:
+                self._blocks.move_to_end(str(path))
+        if cached:
+            try:
+                data = path.read_bytes()
+                os.utime(path)
+                with self._lock:
+                    self.hits += 1
+                return data
+            except OSError:
+                with self._lock:
+                    self.__forget(str(path), key)
+        data = self.__fetch(target, key, index * self.BLOCK_SIZE, self.BLOCK_SIZE)
+        with self._lock:
+            self.misses += 1
+        if data:
+            self.__store(path, key, data)
+        return data
+
+    def __fetch(self, target: str, key: str, start: int, length: int) -> bytes:
+        """
+        请求远程地址的数据，记录文件大小和版本，不支持Range请求时记录为直接读取
+        """
+        try:
+            data, size, _, validator = fetch_range(self._get_session(urlparse(target).hostname), target,
+                                                   start, length, time.monotonic() + self._timeout,
+                                                   self._stop_event)
+        except RangeUnsupported:
+            with self._lock:
+                self._direct.add(key)
+            try:
+                (self._path / key).mkdir(parents=True, exist_ok=True)
+                (self._path / key / "direct").touch()
+            except OSError:
+                pass
+            raise
+        if size is not None:
+            self.__update(key, (size, validator))
+        return data
+
+    def __update(self, key: str, meta: Tuple[int, Optional[str]]):
+        """
+        记录文件大小和版本，与缓存时不一致说明远程文件已被替换，丢弃该地址的所有数据块
+        """
+        with self._lock:
+            known = self._sizes.get(key)
+            if known and known != meta:
+                logger.info(f"FFmpegStrm缩略图Range缓存 {self._targets.get(key) or key} 远程文件已变化，"
+                            f"丢弃已缓存的数据块")
+                for path in [path for path in self._blocks if Path(path).parent.name == key]:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    self.__forget(path, key)
+            self._sizes[key] = meta
+            self._validated[key] = time.monotonic()
+        if known != meta:
+            try:
+                (self._path / key).mkdir(parents=True, exist_ok=True)
+                (self._path / key / "size").write_text(json.dumps({"size": meta[0], "validator": meta[1]}))
+            except OSError as err:
+                logger.warning(f"FFmpegStrm缩略图Range缓存写入 {key} 文件大小失败：{str(err)}")
+
+    def __store(self, path: Path, key: str, data: bytes):
+        """
+        通过临时文件写入数据块，超过容量时淘汰最久未使用的数据块
+        """
+        temp = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp.write_bytes(data)
+            os.replace(temp, path)
+        except OSError as err:
+            logger.warning(f"FFmpegStrm缩略图Range缓存写入 {path} 失败：{str(err)}")
+            if temp.exists():
+                temp.unlink()
+            return
+        with self._lock:
+            if str(path) in self._blocks:
+                self._total -= self._blocks[str(path)]
+            else:
+                self._counts[key] = self._counts.get(key, 0) + 1
+            self._blocks[str(path)] = len(data)
+            self._blocks.move_to_end(str(path))
+            self._total += len(data)
+            self.__evict()
+
+    def __evict(self):
+        while self._total > self._max_size and self._blocks:
+            path = next(iter(self._blocks))
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.__forget(path, Path(path).parent.name)
+
+    def __forget(self, path: str, key: str):
+        """
+        移除数据块记录，地址的数据块全部淘汰后删除文件大小和目录
+        """
+        if path not in self._blocks:
+            return
+        self._total -= self._blocks.pop(path)
+        count = self._counts.get(key, 1) - 1
+        if count > 0:
+            self._counts[key] = count
+            return
+        self._counts.pop(key, None)
+        self._sizes.pop(key, None)
+        self._validated.pop(key, None)
+        directory = self._path / key
+        try:
+            if (directory / "size").exists():
+                (directory / "size").unlink()
+            directory.rmdir()
+        except OSError:
+            pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self._total,
+                "max_size": self._max_size,
+                "blocks": len(self._blocks),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class RangeCacheHandler(BaseHTTPRequestHandler):
+    """
+    本地Range缓存代理的请求处理，按请求的范围拼接数据块返回
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self.__serve(False)
+
+    def do_GET(self):
+        self.__serve(True)
+
+    def __serve(self, body: bool):
+        cache: RangeCache = self.server.cache
+        target = cache.target(self.path.lstrip("/").split("/", 1)[0])
+        if not target:
+            self.send_error(404)
+            return
+        match = re.match(r"bytes=(\d*)-(\d*)$", (self.headers.get("Range") or "").strip())
+        try:
+            if cache.is_direct(target):
+                raise IOError("不支持Range请求")
+            size = cache.size(target, int(match.group(1)) if match and match.group(1) else 0)
+        except Exception as err:
+            # 无法缓存时跳转到远程地址
+            logger.debug(f"FFmpegStrm缩略图Range缓存 {target} 直接读取：{str(err)}")
+            self.send_response(302)
+            self.send_header("Location", target)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start, end = max(size - int(match.group(2)), 0), size - 1
+            if start >= size or start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            start, end = 0, size - 1
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if not body:
+            return
+        try:
+            for index in range(start // RangeCache.BLOCK_SIZE, end // RangeCache.BLOCK_SIZE + 1):
+                offset = index * RangeCache.BLOCK_SIZE
+                chunk = cache.block(target, index)[max(start - offset, 0):end + 1 - offset]
+                if not chunk:
+                    self.close_connection = True
+                    break
+                self.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg跳转位置时会断开之前的连接
+            self.close_connection = True
+        except Exception as err:
+            logger.debug(f"FFmpegStrm缩略图Range缓存 {target} 读取失败：{str(err)}")
+            self.close_connection = True
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+
+class ThumbCache:
+    """
+    缩略图内容寻址缓存，按strm地址、截取时间和编码参数的哈希保存图片
+    指向相同地址的strm文件直接硬链接或复制缓存的图片，与strm文件的路径无关
+    """
+
+    def __init__(self, cache_path: Path):
+        self._path = cache_path
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        return hashlib.sha1(json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+
+    def __file(self, key: str, suffix: str) -> Path:
+        return self._path / key[:2] / f"{key}{suffix}"
+
+    def get(self, key: str, image_path: str) -> bool:
+        """
+        将缓存的图片链接到目标路径，没有缓存时返回False
+        """
+        source = self.__file(key, Path(image_path).suffix)
+        if not source.exists():
+            return False
+        return self.__link(source, Path(image_path))
+
+    def put(self, key: str, image_path: str):
+        """
+        缓存生成的图片
+        """
+        target = self.__file(key, Path(image_path).suffix)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        self.__link(Path(image_path), target)
+
+    @staticmethod
+    def __link(source: Path, target: Path) -> bool:
+        """
+        优先硬链接，跨文件系统时复制，通过临时文件替换目标
+        """
+        temp = target.with_name(f".{target.name}.{threading.get_ident()}.tmp")
+        try:
+            try:
+                os.link(source, temp)
+            except OSError:
+                shutil.copyfile(source, temp)
+            os.replace(temp, target)
+            return True
+        except OSError as err:
+            logger.warning(f"FFmpegStrm缩略图缓存 {source} -> {target} 失败：{str(err)}")
+            if temp.exists():
+                temp.unlink()
+            return False
+
+    def prune(self, max_age: float) -> int:
+        """
+        删除超过保留时间且不再被媒体库硬链接引用的缓存图片，返回删除的数量
+        """
+        if not self._path.exists():
+            return 0
+        deadline = time.time() - max_age
+        count = 0
+        for directory in os.scandir(self._path):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                try:
+                    stat = entry.stat()
+                    if stat.st_nlink <= 1 and stat.st_mtime < deadline:
+                        os.remove(entry.path)
+                        count += 1
+                except OSError:
+                    continue
+        return count
+
+
+class ScanCheckpoint:
+    """
+    扫描断点，目录下的文件全部处理完成后记录该目录，重启后从断点继续扫描
+    扫描路径、排除路径或覆盖生成变化时断点失效
+    """
+
+    def __init__(self, index: ThumbIndex, fingerprint: str):
+        self._index = index
+        self._lock = threading.Lock()
+        # 各目录未处理完成的文件数
+        self._pending: Dict[str, int] = {}
+        # 已遍历完成的目录
+        self._listed: Set[str] = set()
+        if index.get_meta("checkpoint") != fingerprint:
+            index.clear_checkpoints()
+            index.set_meta("checkpoint", fingerprint)
+        self.finished = index.get_checkpoints()
+
+    @staticmethod
+    def fingerprint(scan_paths: str, exclude_paths: str, is_overlay: bool) -> str:
+        return hashlib.sha1(json.dumps([scan_paths, exclude_paths, bool(is_overlay)]).encode()).hexdigest()
+
+    def is_finished(self, directory: Path) -> bool:
+        return str(directory) in self.finished
+
+    def add(self, file_path: Path):
+        """
+        目录下新增一个待处理的文件
+        """
+        with self._lock:
+            directory = str(file_path.parent)
+            self._pending[directory] = self._pending.get(directory, 0) + 1
+
+    def done(self, file_path: Path):
+        """
+        一个文件处理完成
+        """
+        with self._lock:
+            directory = str(file_path.parent)
+            self._pending[directory] = self._pending.get(directory, 1) - 1
+            self.__check(directory)
+
+    def listed(self, directory: Path):
+        """
+        目录遍历完成
+        """
+        with self._lock:
+            self._listed.add(str(directory))
+            self.__check(str(directory))
+
+    def __check(self, directory: str):
+        if directory in self._listed and not self._pending.get(directory):
+            self._listed.discard(directory)
+            self._pending.pop(directory, None)
+            self.finished.add(directory)
+            self._index.add_checkpoint(directory)
+
+    def complete(self):
+        """
+        扫描全部完成，清除断点
+        """
+        self._index.clear_checkpoints()
+        self._index.set_meta("checkpoint", None)
+
+
+class ThumbQueue:
+    """
+    缩略图任务优先队列，扫描、监控、整理完成和手动触发的任务共用，由固定数量的工作线程处理
+    手动触发和手动提升的路径优先，其次按strm文件修改时间从新到旧
+    backlog为已取出但仍在等待的任务数（如按主机并发暂存的任务），与队列长度一起计入容量
+    触发主机限速的任务暂缓到可以处理的时间，期间工作线程跳过这些任务，继续处理其它主机和本地文件
+    容量已满时阻塞遍历，工作线程继续处理其它主机的任务
+    """
+
+    def __init__(self, boost: ExcludeMatcher = None, maxsize: int = 10000, backlog: Callable[[], int] = None):
+        self._boost = boost
+        self._maxsize = maxsize
+        self._backlog = backlog
+        self._heap: List[Tuple[int, float, int, Path, Callable[[], None]]] = []
+        # 暂缓的任务：(可以处理的时间, 序号, 任务)
+        self._delayed: List[Tuple[float, int, Callable[[], None]]] = []
+        self._seq = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, file_path: Path, mtime: float, task: Callable[[], None], stop_event: ThreadEvent,
+            boost: bool = False) -> bool:
+        """
+        加入文件的处理任务，boost为True时优先处理，队列已满时等待，服务停止时返回False
+        """
+        priority = 0 if boost or (self._boost and self._boost.match(file_path)) else 1
+        with self._cond:
+            while len(self._heap) + len(self._delayed) + (self._backlog() if self._backlog else 0) >= self._maxsize:
+                if stop_event.is_set():
+                    return False
+                self._cond.wait(timeout=1)
+            self._seq += 1
+            heapq.heappush(self._heap, (priority, -mtime, self._seq, file_path, task))
+            self._cond.notify_all()
+        return True
+
+    def delay(self, task: Callable[[], None], wait: float):
+        """
+        暂缓已取出的任务，wait秒后再由工作线程取出，不受容量限制
+        """
+        with self._cond:
+            self._seq += 1
+            heapq.heappush(self._delayed, (time.monotonic() + wait, self._seq, task))
+            self._cond.notify_all()
+
+    def get(self, stop_event: ThreadEvent) -> Optional[Callable[[], None]]:
+        """
+        取出已到处理时间的暂缓任务或优先级最高的任务，队列已关闭且为空或服务停止时返回None
+        """
+        with self._cond:
+            while not stop_event.is_set():
+                now = time.monotonic()
+                if self._delayed and self._delayed[0][0] <= now:
+                    task = heapq.heappop(self._delayed)[2]
+                elif self._heap:
+                    task = heapq.heappop(self._heap)[4]
+                elif self._closed and not self._delayed:
+                    return None
+                else:
+                    self._cond.wait(timeout=min(self._delayed[0][0] - now, 1) if self._delayed else 1)
+                    continue
+                self._cond.notify_all()
+                return task
+            return None
+
+    def boost(self, path: str) -> int:
+        """
+        提升队列中指定文件或目录下所有文件的优先级，返回提升的任务数
+        """
+        matcher = ExcludeMatcher([path])
+        count = 0
+        with self._cond:
+            for i, (priority, mtime, seq, file_path, task) in enumerate(self._heap):
+                if priority and matcher.match(file_path):
+                    self._heap[i] = (0, mtime, seq, file_path, task)
+                    count += 1
+            if count:
+                heapq.heapify(self._heap)
+        return count
+
+    def close(self):
+        """
+        不再处理新任务，队列为空后工作线程退出
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._heap) + len(self._delayed)
+
+
+class TaskCounter:
+    """
+    一批任务中尚未完成的数量，用于等待提交到共用队列的任务全部完成
+    """
+
+    def __init__(self):
+        self._count = 0
+        self._cond = threading.Condition()
+
+    def add(self):
+        with self._cond:
+            self._count += 1
+
+    def done(self):
+        with self._cond:
+            self._count -= 1
+            self._cond.notify_all()
+
+    def wait(self, stop_event: ThreadEvent) -> bool:
+        """
+        等待所有任务完成，服务停止时返回False
+        """
+        with self._cond:
+            while self._count > 0:
+                if stop_event.is_set():
+                    return False
+                self._cond.wait(timeout=1)
+        return True
+
+
+class ScanMetrics:
+    """
+    扫描进度和吞吐统计，最近一次扫描的文件计数、处理速度、ffmpeg耗时分位数和预计剩余时间
+    """
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        # 最近的ffmpeg耗时
+        self._latencies = deque(maxlen=window)
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.walking = False
+        # 本次扫描加入队列和已处理完成的文件数
+        self.seen = 0
+        self.completed = 0
+        # 跳过、缓存命中、生成、失败的文件数，包含实时监控处理的文件
+        self.skipped = 0
+        self.cached = 0
+        self.generated = 0
+        self.failed = 0
+
+    def start(self):
+        with self._lock:
+            self.started = time.time()
+            self.finished = None
+            self.walking = True
+            self.seen = self.completed = self.skipped = self.cached = self.generated = self.failed = 0
+            self._latencies.clear()
+
+    def walk_done(self):
+        with self._lock:
+            self.walking = False
+
+    def finish(self):
+        with self._lock:
+            self.walking = False
+            self.finished = time.time()
+
+    def incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def add_latency(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def mean_latency(self) -> Optional[float]:
+        with self._lock:
+            return sum(self._latencies) / len(self._latencies) if self._latencies else None
+
+    def snapshot(self, queue_depth: int = 0) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            running = self.started is not None and self.finished is None
+            elapsed = ((self.finished or time.time()) - self.started) if self.started else 0
+            rate = self.completed / elapsed if elapsed > 0 else 0
+            pending = max(self.seen - self.completed, 0)
+            if not running:
+                state = "空闲"
+            elif self.walking:
+                state = "遍历中"
+            else:
+                state = "生成中"
+            return {
+                "state": state,
+                "started": datetime.fromtimestamp(self.started).strftime('%Y-%m-%d %H:%M:%S')
+                if self.started else None,
+                "elapsed": round(elapsed, 1),
+                "seen": self.seen,
+                "completed": self.completed,
+                "skipped": self.skipped,
+                "cached": self.cached,
+                "generated": self.generated,
+                "failed": self.failed,
+                "queue": queue_depth,
+                "pending": pending,
+                "files_per_sec": round(rate, 2),
+                "ffmpeg_p50": self.__percentile(latencies, 50),
+                "ffmpeg_p95": self.__percentile(latencies, 95),
+                # 遍历未完成时只是已发现文件的剩余时间
+                "eta": round(pending / rate) if running and rate > 0 else None,
+            }
+
+    @staticmethod
+    def __percentile(values: List[float], percent: int) -> Optional[float]:
+        if not values:
+            return None
+        return round(values[min(len(values) * percent // 100, len(values) - 1)], 2)
+
+
+class ScanCoordinator:
+    """
+    扫描协调，同一时间只运行一个扫描，扫描期间的再次触发合并为一次补充扫描
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running = False
+        self.overlay = False
+        self.trigger: Optional[str] = None
+        self.started: Optional[float] = None
+        # 扫描完成后的补充扫描：None为没有，否则为是否覆盖生成
+        self.pending: Optional[bool] = None
+        self.pending_triggers: List[str] = []
+
+    def begin(self, is_overlay: bool, trigger: str) -> bool:
+        """
+        开始扫描，已有扫描在运行时合并为补充扫描并返回False
+        """
+        with self._lock:
+            if self.running:
+                self.pending = bool(self.pending) or is_overlay
+                if trigger not in self.pending_triggers:
+                    self.pending_triggers.append(trigger)
+                return False
+            self.running = True
+            self.overlay = is_overlay
+            self.trigger = trigger
+            self.started = time.time()
+            return True
+
+    def next(self) -> Optional[bool]:
+        """
+        取出补充扫描，没有时结束运行状态并返回None
+        """
+        with self._lock:
+            if self.pending is None:
+                self.running = False
+                return None
+            self.overlay = self.pending
+            self.trigger = "、".join(self.pending_triggers)
+            self.started = time.time()
+            self.pending = None
+            self.pending_triggers = []
+            return self.overlay
+
+    def cancel(self):
+        """
+        扫描中止，丢弃补充扫描
+        """
+        with self._lock:
+            self.running = False
+            self.pending = None
+            self.pending_triggers = []
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": self.running,
+                "overlay": self.overlay,
+                "trigger": self.trigger,
+                "started": datetime.fromtimestamp(self.started).strftime('%Y-%m-%d %H:%M:%S')
+                if self.started else None,
+                "pending": self.pending is not None,
+                "pending_overlay": bool(self.pending),
+                "pending_triggers": list(self.pending_triggers),
+            }
+
+
+class StrmFileHandler(FileSystemEventHandler):
+    """
+    strm文件变化监听
+    """
+
+    def __init__(self, callback, **kwargs):
+        super().__init__(**kwargs)
+        self._callback = callback
+
+    def on_created(self, event: FileSystemEvent):
+        if not event.is_directory:
+            self._callback(event.src_path)
+
+    def on_modified(self, event: FileSystemEvent):
+        if not event.is_directory:
+            self._callback(event.src_path)
+
+    def on_moved(self, event: FileSystemEvent):
+        if not event.is_directory:
+            self._callback(event.dest_path)
 
 
 class FFmpegStrmThumb(_PluginBase):
@@ -27,7 +1587,7 @@ class FFmpegStrmThumb(_PluginBase):
     # 插件图标
     plugin_icon = "https://raw.githubusercontent.com/imaliang/MoviePilot-Plugins/main/icons/ffmpegstrm.png"
     # 插件版本
-    plugin_version = "1.2"
+    plugin_version = "3.6"
     # 插件作者
     plugin_author = "imaliang"
     # 作者主页
@@ -48,10 +1608,77 @@ class FFmpegStrmThumb(_PluginBase):
     _scan_paths = ""
     _exclude_paths = ""
     _overlay = False
-    _gen_strategy = "100=60"
-    _gen_strategy_count = 0
-    _gen_strategy_max_count = 100
-    _gen_strategy_delay = 60
+    _dry_run = False
+    _rate_limit = "30=10"
+    _thread_count = 2
+    _profile = "balanced"
+    _thumb_format = "jpg"
+    _thumb_width: Optional[int] = None
+    _thumb_quality: Optional[int] = None
+    _thumb_cache = False
+    _backend = "ffmpeg"
+    # Range缓存容量，MB，0为不使用
+    _range_cache_size = 0
+    _range_cache: Optional[RangeCache] = None
+    # PyAV后端按主机复用的HTTP连接池
+    _sessions: Dict[str, requests.Session] = {}
+    _session_lock = threading.Lock()
+    # 不支持Range请求的主机，PyAV后端直接使用ffmpeg命令
+    _range_unsupported: Set[str] = set()
+    _governor_enabled = False
+    _load_limit = ""
+    _net_limit = ""
+    _pause_hours = ""
+    # 负载调节
+    _governor: Optional[LoadGovernor] = None
+    # 缩略图缓存
+    _cache: Optional[ThumbCache] = None
+    _ffmpeg_timeout = 120
+    _failure_backoff = "1=168"
+    _clear_failures = False
+    _extra_outputs = ""
+    _boost_paths = ""
+    _transfer_event = False
+    # 手动和整理完成触发的目录遍历、扫描预估等后台任务，不直接生成缩略图
+    _task_executor: Optional[ThreadPoolExecutor] = None
+    _task_lock = threading.Lock()
+    # 扫描预估是否正在进行
+    _planning = False
+    # 截图方案测速是否正在进行
+    _benchmarking = False
+    _task_timers: List[threading.Timer] = []
+    # 共用的任务队列和工作线程，同时运行的ffmpeg进程不超过并发数量
+    _queue: Optional[ThumbQueue] = None
+    _workers: Optional[ThreadPoolExecutor] = None
+    # 扫描进度统计
+    _metrics = ScanMetrics()
+    # 扫描协调
+    _coordinator = ScanCoordinator()
+    # 附加输出：[(文件名后缀, 截取时间, 宽度)]
+    _outputs: List[Tuple[str, Optional[str], Optional[int]]] = []
+    _incremental = True
+    # 扫描索引
+    _index: Optional[ThumbIndex] = None
+    # 按主机限速
+    _limiter: Optional[HostRateLimiter] = None
+    _host_limits = ""
+    # 按主机限制并发
+    _concurrency: Optional[HostConcurrency] = None
+    _monitor = False
+    _monitor_mode = "fast"
+    _monitor_debounce = 10
+    _observers = []
+    # 监控到的待处理文件：{文件路径: 最后变化时间}
+    _monitor_files: Dict[str, float] = {}
+    _monitor_lock = threading.Lock()
+    _monitor_stop = ThreadEvent()
+    # 工作线程的执行状态，记录最近一次命令的错误信息
+    _thread_state = threading.local()
+    # 正在处理的strm文件，扫描、监控和整理完成同时触发时只处理一次
+    _inflight: Set[str] = set()
+    _inflight_lock = threading.Lock()
+    # 正在生成的缩略图缓存键和等待该缓存键的任务，相同strm地址的其它文件生成完成后直接使用缓存
+    _cache_inflight: Dict[str, List[Callable[[], None]]] = {}
     # 退出事件
     _event = ThreadEvent()
 
@@ -61,18 +1688,103 @@ class FFmpegStrmThumb(_PluginBase):
             self._enabled = config.get("enabled")
             self._onlyonce = config.get("onlyonce")
             self._cron = config.get("cron")
-            self._timeline = config.get("timeline")
+            self._timeline = config.get("timeline") or "00:03:01"
             self._scan_paths = config.get("scan_paths") or ""
             self._exclude_paths = config.get("exclude_paths") or ""
             self._overlay = config.get("overlay") or False
-            self._gen_strategy = config.get("gen_strategy") or "100=60"
-            gen_strategy = self._gen_strategy.split("=")
-            self._gen_strategy_max_count = int(gen_strategy[0])
-            self._gen_strategy_delay = int(gen_strategy[1])
+            self._dry_run = config.get("dry_run") or False
+            self._rate_limit = config.get("rate_limit") or "30=10"
+            self._host_limits = config.get("host_limits") or ""
+            try:
+                self._thread_count = max(int(config.get("thread_count") or 2), 1)
+            except ValueError:
+                self._thread_count = 2
+            self._incremental = config.get("incremental", True)
+            self._profile = config.get("profile") or "balanced"
+            self._thumb_format = config.get("thumb_format") or "jpg"
+            self._thumb_cache = config.get("thumb_cache") or False
+            self._backend = config.get("backend") or "ffmpeg"
+            try:
+                self._range_cache_size = max(int(config.get("range_cache") or 0), 0)
+            except ValueError:
+                self._range_cache_size = 0
+            self._governor_enabled = config.get("governor") or False
+            self._load_limit = config.get("load_limit") or ""
+            self._net_limit = config.get("net_limit") or ""
+            self._pause_hours = config.get("pause_hours") or ""
+            if self._thumb_format not in THUMB_FORMATS:
+                self._thumb_format = "jpg"
+            try:
+                self._thumb_width = max(int(config.get("thumb_width")), 16) if config.get("thumb_width") else None
+            except ValueError:
+                self._thumb_width = None
+            try:
+                self._thumb_quality = min(max(int(config.get("thumb_quality")), 1), 100) \
+                    if config.get("thumb_quality") else None
+            except ValueError:
+                self._thumb_quality = None
+            try:
+                self._ffmpeg_timeout = max(int(config.get("ffmpeg_timeout") or 120), 5)
+            except ValueError:
+                self._ffmpeg_timeout = 120
+            self._failure_backoff = config.get("failure_backoff") or "1=168"
+            self._clear_failures = config.get("clear_failures") or False
+            self._extra_outputs = config.get("extra_outputs") or ""
+            self._boost_paths = config.get("boost_paths") or ""
+            self._transfer_event = config.get("transfer_event") or False
+            self._monitor = config.get("monitor") or False
+            self._monitor_mode = config.get("monitor_mode") or "fast"
+            try:
+                self._monitor_debounce = max(int(config.get("monitor_debounce") or 10), 1)
+            except ValueError:
+                self._monitor_debounce = 10
 
         # 停止现有任务
         self.stop_service()
 
+        try:
+            rate, burst = self._rate_limit.split("=")
+            self._limiter = HostRateLimiter(float(rate), int(burst))
+        except ValueError:
+            logger.error(f"FFmpegStrm缩略图限速配置错误：{self._rate_limit}，使用默认值 30=10")
+            self._limiter = HostRateLimiter(30, 10)
+        if not self.__is_valid_time(self._timeline):
+            logger.error(f"FFmpegStrm缩略图截取时间配置错误：{self._timeline}，使用默认值 00:03:01")
+            self._timeline = "00:03:01"
+        self._concurrency = self.__build_concurrency()
+        self._outputs = self.__parse_outputs()
+        if self._backend == "pyav" and not av:
+            logger.warning(f"FFmpegStrm缩略图未安装PyAV，使用ffmpeg命令截图")
+        self._metrics = ScanMetrics()
+        self._governor = self.__build_governor() if self._governor_enabled else None
+
+        try:
+            self._index = ThumbIndex(self.get_data_path() / "index.db")
+        except Exception as e:
+            logger.error(f"FFmpegStrm缩略图扫描索引加载失败，将进行全量扫描：{str(e)}")
+        if self._index:
+            self.__check_outputs()
+        self._cache = ThumbCache(self.get_data_path() / "thumbs") if self._thumb_cache else None
+        if self._range_cache_size:
+            try:
+                self._range_cache = RangeCache(self.get_data_path() / "ranges", self._range_cache_size * 1024 * 1024,
+                                               self.__get_session, self._ffmpeg_timeout)
+                self._range_cache.start()
+            except Exception as e:
+                logger.error(f"FFmpegStrm缩略图Range缓存启动失败，直接读取远程地址：{str(e)}")
+                self._range_cache = None
+
+        # 清除失败记录
+        if self._clear_failures:
+            if self._index:
+                logger.info(f"FFmpegStrm缩略图已清除{self._index.clear_failures()}条失败记录")
+            self._clear_failures = False
+            self.__update_config()
+
+        # 启动目录监控
+        if self._enabled and self._monitor:
+            self.__start_monitor()
+
         # 启动定时任务 & 立即运行一次
         if self._enabled or self._onlyonce:
             self._scheduler = BackgroundScheduler(timezone=settings.TZ)
@@ -84,45 +1796,505 @@ class FFmpegStrmThumb(_PluginBase):
                                             trigger=CronTrigger.from_crontab(
                                                 self._cron),
                                             name="FFmpegStrm缩略图",
-                                            args=[False])
+                                            args=[False, "定时任务"])
                 except Exception as e:
                     logger.error(f"FFmpegStrm缩略图服务启动失败，原因：{str(e)}")
                     self.systemmessage.put(
                         f"FFmpegStrm缩略图服务启动失败，原因：{str(e)}", title="FFmpegStrm缩略图")
+            if self._enabled and not self._onlyonce and self.__has_overlay_checkpoint():
+                logger.info(f"FFmpegStrm缩略图服务，发现未完成的覆盖生成，从断点继续")
+                self._scheduler.add_job(func=self.__libraryscan, trigger='date',
+                                        run_date=datetime.now(tz=pytz.timezone(
+                                            settings.TZ)) + timedelta(seconds=30),
+                                        name="FFmpegStrm缩略图",
+                                        args=[True, "断点续扫"])
             if self._onlyonce:
                 logger.info(f"FFmpegStrm缩略图服务，立即运行一次")
                 is_overlay = self._overlay
-                self._scheduler.add_job(func=self.__libraryscan, trigger='date',
+                self._scheduler.add_job(func=self.plan if self._dry_run else self.__libraryscan, trigger='date',
                                         run_date=datetime.now(tz=pytz.timezone(
                                             settings.TZ)) + timedelta(seconds=3),
                                         name="FFmpegStrm缩略图",
-                                        args=[is_overlay])
+                                        args=[is_overlay] if self._dry_run else [is_overlay, "立即运行一次"])
                 # 关闭一次性开关
                 self._onlyonce = False
-                self.update_config({
-                    "onlyonce": False,
-                    "enabled": self._enabled,
-                    "cron": self._cron,
-                    "timeline": self._timeline,
-                    "scan_paths": self._scan_paths,
-                    "exclude_paths": self._exclude_paths,
-                    "overlay": self._overlay,
-                    "gen_strategy": self._gen_strategy,
-                })
+                self.__update_config()
             if self._scheduler.get_jobs():
                 # 启动服务
                 self._scheduler.print_jobs()
                 self._scheduler.start()
 
+    def __has_overlay_checkpoint(self) -> bool:
+        """
+        是否有与当前配置一致的未完成覆盖生成断点
+        """
+        if not self._index or not self._scan_paths:
+            return False
+        fingerprint = ScanCheckpoint.fingerprint(self._scan_paths, self._exclude_paths, True)
+        return self._index.get_meta("checkpoint") == fingerprint and bool(self._index.get_checkpoints())
+
+    def __check_outputs(self):
+        """
+        输出的图片格式或附加输出变化后，已完成的文件需要生成新的图片，重置为待处理
+        """
+        fingerprint = json.dumps(self.__output_names(Path("x.strm")), ensure_ascii=False)
+        if self._index.get_meta("outputs") == fingerprint:
+            return
+        count = self._index.reset_done()
+        if count:
+            logger.info(f"FFmpegStrm缩略图输出配置已变化，{count}个已完成的文件将在下次扫描时重新检查")
+        self._index.set_meta("outputs", fingerprint)
+
+    def __update_config(self):
+        self.update_config({
+            "onlyonce": self._onlyonce,
+            "enabled": self._enabled,
+            "cron": self._cron,
+            "timeline": self._timeline,
+            "scan_paths": self._scan_paths,
+            "exclude_paths": self._exclude_paths,
+            "overlay": self._overlay,
+            "dry_run": self._dry_run,
+            "rate_limit": self._rate_limit,
+            "host_limits": self._host_limits,
+            "thread_count": self._thread_count,
+            "incremental": self._incremental,
+            "profile": self._profile,
+            "thumb_format": self._thumb_format,
+            "thumb_width": self._thumb_width,
+            "thumb_quality": self._thumb_quality,
+            "thumb_cache": self._thumb_cache,
+            "backend": self._backend,
+            "range_cache": self._range_cache_size,
+            "governor": self._governor_enabled,
+            "load_limit": self._load_limit,
+            "net_limit": self._net_limit,
+            "pause_hours": self._pause_hours,
+            "extra_outputs": self._extra_outputs,
+            "boost_paths": self._boost_paths,
+            "transfer_event": self._transfer_event,
+            "monitor": self._monitor,
+            "monitor_mode": self._monitor_mode,
+            "monitor_debounce": self._monitor_debounce,
+            "ffmpeg_timeout": self._ffmpeg_timeout,
+            "failure_backoff": self._failure_backoff,
+            "clear_failures": self._clear_failures,
+        })
+
     def get_state(self) -> bool:
         return self._enabled
 
     @staticmethod
     def get_command() -> List[Dict[str, Any]]:
-        pass
+        """
+        定义远程控制命令
+        :return: 命令关键字、事件、描述、附带数据
+        """
+        return [{
+            "cmd": "/ffmpeg_thumb",
+            "event": EventType.PluginAction,
+            "desc": "生成strm缩略图",
+            "category": "媒体库",
+            "data": {
+                "action": "ffmpeg_strm_thumb"
+            }
+        }]
 
     def get_api(self) -> List[Dict[str, Any]]:
-        pass
+        return [
+            {
+                "path": "/benchmark",
+                "endpoint": self.benchmark,
+                "methods": ["GET"],
+                "summary": "截图方案测速",
+                "description": "查询最近一次测速结果；refresh为true时在后台使用各截图方案对扫描路径下指定strm文件"
+                               "或目录下的前几个strm文件截图，按主机限速和并发数量执行，记录每个文件的耗时",
+            },
+            {
+                "path": "/generate",
+                "endpoint": self.generate,
+                "methods": ["GET"],
+                "summary": "生成指定路径的缩略图",
+                "description": "立即为扫描路径下的指定strm文件或目录生成缩略图，overlay为true时覆盖已有图片",
+            },
+            {
+                "path": "/plan",
+                "endpoint": self.get_plan,
+                "methods": ["GET"],
+                "summary": "扫描预估",
+                "description": "查询最近一次扫描预估；refresh为true时在后台重新遍历扫描路径，统计文件数量、已有缩略图、"
+                               "缺失和失败的文件，并按实测耗时预估扫描时间，不调用ffmpeg",
+            },
+            {
+                "path": "/boost",
+                "endpoint": self.boost,
+                "methods": ["GET"],
+                "summary": "提升优先级",
+                "description": "正在扫描时，优先处理指定文件或目录下排队中的strm文件",
+            },
+            {
+                "path": "/metrics",
+                "endpoint": self.get_metrics,
+                "methods": ["GET"],
+                "summary": "扫描进度",
+                "description": "查询最近一次扫描的文件计数、队列长度、处理速度、ffmpeg耗时和预计剩余时间",
+            },
+            {
+                "path": "/failures",
+                "endpoint": self.get_failures,
+                "methods": ["GET"],
+                "summary": "查询失败记录",
+                "description": "查询最近生成失败的文件、失败次数和下次重试时间",
+            },
+            {
+                "path": "/reset_failures",
+                "endpoint": self.reset_failures,
+                "methods": ["GET"],
+                "summary": "清除失败记录",
+                "description": "清除指定文件或目录的失败记录，不指定路径时清除全部，下次扫描时立即重试",
+            }
+        ]
+
+    def generate(self, path: str, overlay: bool = False) -> Dict[str, Any]:
+        """
+        生成指定路径的缩略图
+        """
+        if isinstance(overlay, str):
+            overlay = overlay.lower() in ("1", "true", "yes")
+        success, message = self.enqueue(path, overlay)
+        return {"success": success, "message": message}
+
+    @eventmanager.register(EventType.PluginAction)
+    def remote_generate(self, event: Event = None):
+        """
+        远程命令生成缩略图：/ffmpeg_thumb 路径
+        """
+        if not event:
+            return
+        event_data = event.event_data
+        if not event_data or event_data.get("action") != "ffmpeg_strm_thumb":
+            return
+        path = (event_data.get("arg_str") or "").strip()
+        if not path:
+            message = "请在命令后指定strm文件或目录，如 /ffmpeg_thumb /media/电视剧/xxx/Season 1"
+        else:
+            logger.info(f"收到命令，生成缩略图：{path}")
+            _, message = self.enqueue(path)
+        self.post_message(channel=event_data.get("channel"), mtype=NotificationType.Plugin,
+                          title="FFmpegStrm缩略图", text=message, userid=event_data.get("user"))
+
+    @eventmanager.register(EventType.TransferComplete)
+    def transfer_complete(self, event: Event = None):
+        """
+        整理完成后生成目标目录的缩略图
+        """
+        if not self._enabled or not self._transfer_event or not event or not event.event_data:
+            return
+        transferinfo = event.event_data.get("transferinfo")
+        if not transferinfo or not self.__get_value(transferinfo, "success"):
+            return
+        path = self.__get_value(transferinfo, "target_diritem", "path") \
+            or self.__get_value(transferinfo, "target_path")
+        if not path or not self.__in_scan_paths(Path(str(path))):
+            return
+        # 等待strm文件生成完成
+        logger.info(f"FFmpegStrm缩略图整理完成，{self._monitor_debounce}秒后生成：{path}")
+        timer = threading.Timer(self._monitor_debounce, self.enqueue, args=[str(path)])
+        timer.daemon = True
+        with self._task_lock:
+            self._task_timers = [t for t in self._task_timers if t.is_alive()] + [timer]
+        timer.start()
+
+    @staticmethod
+    def __get_value(data: Any, *keys: str) -> Any:
+        """
+        逐级读取事件数据的字段，兼容字典和对象
+        """
+        for key in keys:
+            if data is None:
+                return None
+            data = data.get(key) if isinstance(data, dict) else getattr(data, key, None)
+        return data
+
+    def __in_scan_paths(self, path: Path) -> bool:
+        return any(path == Path(scan_path) or Path(scan_path) in path.parents
+                   for scan_path in self._scan_paths.split("\n") if scan_path)
+
+    def enqueue(self, path: str, is_overlay: bool = False) -> Tuple[bool, str]:
+        """
+        将扫描路径下的strm文件或目录加入生成任务
+        """
+        if not path:
+            return False, "未指定路径"
+        target = Path(path)
+        if not self.__in_scan_paths(target):
+            return False, f"{path} 不在扫描路径中"
+        exclude = ExcludeMatcher(self._exclude_paths.split("\n"))
+        if exclude.match(target):
+            return False, f"{path} 在排除目录中"
+        if target.is_file():
+            if target.suffix.lower() != ".strm":
+                return False, f"{path} 不是strm文件"
+            self.__submit_task(self.__queue_file, target, is_overlay)
+        elif target.is_dir():
+            self.__submit_task(self.__generate_dir, target, is_overlay, exclude)
+        else:
+            return False, f"{path} 不存在"
+        logger.info(f"FFmpegStrm缩略图已加入生成任务：{path}")
+        return True, f"已加入生成任务：{path}"
+
+    def __generate_dir(self, directory: Path, is_overlay: bool, exclude: ExcludeMatcher):
+        """
+        遍历目录，将其中的strm文件加入任务队列
+        """
+        count = 0
+        for file_path, mtime, listing in self.__list_strm_files(directory, is_overlay, exclude):
+            if not self.__queue_file(file_path, is_overlay, mtime, listing):
+                return
+            count += 1
+        logger.info(f"FFmpegStrm缩略图目录 {directory} 遍历完成，共{count}个文件待处理")
+
+    def __queue_file(self, file_path: Path, is_overlay: bool, mtime: float = None,
+                     listing: Set[str] = None) -> bool:
+        """
+        将手动、监控或整理完成触发的strm文件加入任务队列，优先于扫描中的文件处理，服务停止时返回False
+        """
+        queue = self.__get_queue()
+        if queue is None:
+            return False
+        if mtime is None:
+            try:
+                mtime = file_path.stat().st_mtime
+            except OSError:
+                mtime = time.time()
+        return queue.put(file_path, mtime, partial(self.gen_file_thumb, file_path, is_overlay, None, listing),
+                         self._event, boost=True)
+
+    def __get_queue(self) -> Optional[ThumbQueue]:
+        """
+        获取共用的任务队列，首次使用时启动工作线程，服务停止时返回None
+        """
+        with self._task_lock:
+            if self._event.is_set():
+                return None
+            if self._queue is None:
+                self._queue = ThumbQueue(ExcludeMatcher(self._boost_paths.split("\n")) if self._boost_paths else None,
+                                         backlog=self._concurrency.parked)
+                self._workers = ThreadPoolExecutor(max_workers=self._thread_count,
+                                                   thread_name_prefix="FFmpegStrmThumb")
+                for _ in range(self._thread_count):
+                    self._workers.submit(self.__worker, self._queue)
+            return self._queue
+
+    def __worker(self, queue: ThumbQueue):
+        """
+        工作线程，从队列中按优先级取出任务处理
+        """
+        while True:
+            task = queue.get(self._event)
+            if not task:
+                return
+            try:
+                task()
+            except Exception as err:
+                logger.error(f"FFmpegStrm缩略图处理任务时发生错误：{str(err)}")
+
+    def __submit_task(self, func: Callable, *args) -> bool:
+        with self._task_lock:
+            if self._event.is_set():
+                return False
+            if not self._task_executor:
+                self._task_executor = ThreadPoolExecutor(max_workers=self._thread_count,
+                                                         thread_name_prefix="FFmpegStrmThumbTask")
+            try:
+                self._task_executor.submit(func, *args)
+            except RuntimeError:
+                return False
+        return True
+
+    def get_plan(self, overlay: bool = False, refresh: bool = False) -> Dict[str, Any]:
+        """
+        查询最近一次扫描预估，refresh为true时在后台重新预估
+        """
+        if isinstance(overlay, str):
+            overlay = overlay.lower() in ("1", "true", "yes")
+        if isinstance(refresh, str):
+            refresh = refresh.lower() in ("1", "true", "yes")
+        if refresh:
+            if not self._scan_paths:
+                return {"success": False, "message": "未配置扫描路径"}
+            with self._task_lock:
+                if self._planning:
+                    return {"success": False, "message": "扫描预估正在进行中"}
+                self._planning = True
+            if not self.__submit_task(self.plan, overlay):
+                self._planning = False
+                return {"success": False, "message": "服务已停止"}
+            return {"success": True, "message": "已开始扫描预估，完成后重新查询"}
+        plan = self.get_data("plan")
+        if not plan:
+            return {"success": False, "message": "没有扫描预估，请使用refresh=true开始预估"}
+        return {"success": True, "data": plan, "running": self._planning}
+
+    def plan(self, overlay: bool = False) -> Dict[str, Any]:
+        """
+        扫描预估，只遍历目录和读取待生成的strm文件，不修改扫描索引
+        """
+        self._planning = True
+        try:
+            return self.__plan(overlay)
+        finally:
+            self._planning = False
+
+    def __plan(self, overlay: bool) -> Dict[str, Any]:
+        if not self._scan_paths:
+            return {"success": False, "message": "未配置扫描路径"}
+        start = time.monotonic()
+        exclude = ExcludeMatcher(self._exclude_paths.split("\n"))
+        retries = self._index.get_failure_retries() if self._index else {}
+        paths = []
+        # 各主机待生成的文件数
+        hosts: Dict[Optional[str], int] = {}
+        for path in self._scan_paths.split("\n"):
+            if not path:
+                continue
+            if not Path(path).exists():
+                logger.warning(f"FFmpegStrm缩略图扫描路径不存在：{path}")
+                continue
+            stats = self.__plan_path(Path(path), overlay, exclude, retries, hosts)
+            if self._event.is_set():
+                return {"success": False, "message": "服务已停止"}
+            paths.append(stats)
+        total = {key: sum(stats[key] for stats in paths)
+                 for key in ("total", "excluded", "excluded_dirs", "thumbed", "missing", "failed", "pending")}
+        # 按实测的ffmpeg耗时预估，取并发、单主机并发和单主机限速中最慢的一项
+        latency = self._metrics.mean_latency()
+        if latency is None and self._index:
+            latency = float(self._index.get_meta("latency") or 0) or None
+        estimate = None
+        if latency:
+            estimate = total["pending"] * latency / self._thread_count
+            for host, count in hosts.items():
+                limit = self._concurrency.limit(host)
+                if limit:
+                    estimate = max(estimate, count * latency / limit)
+                if host:
+                    estimate = max(estimate, self._limiter.estimate(count))
+        result = {
+            "time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "overlay": overlay,
+            "paths": paths,
+            "total": total,
+            "hosts": {host or "本地": count for host, count in hosts.items()},
+            "latency": round(latency, 2) if latency else None,
+            "estimate": round(estimate) if estimate is not None else None,
+            "elapsed": round(time.monotonic() - start, 2),
+        }
+        self.save_data("plan", result)
+        logger.info(f"FFmpegStrm缩略图扫描预估完成：共{total['total']}个文件，待生成{total['pending']}个，"
+                    f"预计耗时{timedelta(seconds=result['estimate']) if estimate is not None else '未知'}")
+        return {"success": True, "data": result}
+
+    def __plan_path(self, scan_path: Path, is_overlay: bool, exclude: ExcludeMatcher,
+                    retries: Dict[str, float], hosts: Dict[Optional[str], int]) -> Dict[str, Any]:
+        """
+        统计一个扫描路径：全部、排除、已有缩略图、缺失、失败等待重试和待生成的文件数
+        与扫描一样不进入排除目录，排除目录只计数，不统计其中的文件
+        """
+        stats = {"path": str(scan_path), "total": 0, "excluded": 0, "excluded_dirs": 0, "thumbed": 0,
+                 "missing": 0, "failed": 0, "pending": 0}
+        now = time.time()
+        if exclude.match(scan_path):
+            stats["excluded_dirs"] += 1
+            return stats
+        dirs = [scan_path]
+        while dirs:
+            if self._event.is_set():
+                return stats
+            directory = dirs.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    entries = list(entries)
+            except OSError as err:
+                logger.warning(f"FFmpegStrm缩略图扫描目录 {directory} 失败：{str(err)}")
+                continue
+            listing = {entry.name for entry in entries}
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdir = Path(entry.path)
+                    if exclude.match(subdir):
+                        stats["excluded_dirs"] += 1
+                    else:
+                        dirs.append(subdir)
+                    continue
+                if not entry.name.lower().endswith(".strm"):
+                    continue
+                stats["total"] += 1
+                file_path = Path(entry.path)
+                if exclude.match_file(file_path):
+                    stats["excluded"] += 1
+                    continue
+                if all(name in listing for name in self.__output_names(file_path)):
+                    stats["thumbed"] += 1
+                    if not is_overlay:
+                        continue
+                else:
+                    stats["missing"] += 1
+                if retries.get(entry.path, 0) > now:
+                    stats["failed"] += 1
+                    continue
+                stats["pending"] += 1
+                try:
+                    with open(file_path, 'r', encoding='utf-8') as file:
+                        host = self.__get_host(file.read())
+                except OSError:
+                    host = None
+                hosts[host] = hosts.get(host, 0) + 1
+        return stats
+
+    def boost(self, path: str) -> Dict[str, Any]:
+        """
+        提升排队中的任务优先级
+        """
+        if not path:
+            return {"success": False, "message": "未指定路径"}
+        queue = self._queue
+        if queue is None:
+            return {"success": False, "message": "当前没有排队的任务"}
+        count = queue.boost(path)
+        logger.info(f"FFmpegStrm缩略图已提升{count}个任务的优先级：{path}")
+        return {"success": True, "message": f"已提升{count}个任务的优先级"}
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        查询扫描进度
+        """
+        queue = self._queue
+        data = self._metrics.snapshot(len(queue) if queue is not None else 0)
+        data["scan"] = self._coordinator.snapshot()
+        if self._governor:
+            data["governor"] = self._governor.snapshot()
+        if self._range_cache:
+            data["range_cache"] = self._range_cache.snapshot()
+        return {"success": True, "data": data}
+
+    def get_failures(self, limit: int = 100) -> Dict[str, Any]:
+        """
+        查询失败记录
+        """
+        if not self._index:
+            return {"success": False, "message": "扫描索引未加载"}
+        return {"success": True, "data": self._index.list_failures(limit)}
+
+    def reset_failures(self, path: str = None) -> Dict[str, Any]:
+        """
+        清除失败记录
+        """
+        if not self._index:
+            return {"success": False, "message": "扫描索引未加载"}
+        count = self._index.clear_failures(path)
+        logger.info(f"FFmpegStrm缩略图已清除{count}条失败记录")
+        return {"success": True, "message": f"已清除{count}条失败记录"}
 
     def get_form(self) -> Tuple[List[dict], Dict[str, Any]]:
         return [
@@ -136,14 +2308,321 @@ class FFmpegStrmThumb(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'enabled',
+                                            'label': '启用插件',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'onlyonce',
+                                            'label': '立即运行一次',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'overlay',
+                                            'label': '覆盖生成',
+                                            'hint': '对所有文件重新生成缩略图，只对立即运行一次生效，未完成的覆盖生成在插件启动后自动继续',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'incremental',
+                                            'label': '增量扫描',
+                                            'hint': '记录目录的修改时间，之后只扫描有变化的目录以及新增或生成失败的文件',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'dry_run',
+                                            'label': '仅预估不生成',
+                                            'hint': '立即运行一次只统计各扫描路径的文件数量和预计耗时，结果显示在插件页面',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'timeline',
+                                            'label': '截取时间',
+                                            'placeholder': '00:03:01 或 10%',
+                                            'hint': '可以填写视频时长的百分比如 10%，视频时长由ffprobe探测后缓存',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSelect',
+                                        'props': {
+                                            'model': 'profile',
+                                            'label': '截图方案',
+                                            'items': [
+                                                {'title': profile.get("name"), 'value': key}
+                                                for key, profile in FFMPEG_PROFILES.items()
+                                            ],
+                                            'hint': '画质优先精确定位并输出原图；均衡定位到关键帧并缩放到1280宽；速度优先只解码关键帧并缩放到640宽',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'rate_limit',
+                                            'label': '单主机限速',
+                                            'placeholder': '30=10',
+                                            'hint': '某个主机限速时，其它主机和本地文件不受影响',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'cron',
+                                            'label': '定时扫描周期',
+                                            'placeholder': '5位cron表达式，留空关闭',
+                                            'hint': '同一时间只运行一个扫描，扫描期间的触发会在完成后合并为一次补充扫描',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSelect',
+                                        'props': {
+                                            'model': 'thumb_format',
+                                            'label': '缩略图格式',
+                                            'items': [
+                                                {'title': thumb_format.get("name"), 'value': key}
+                                                for key, thumb_format in THUMB_FORMATS.items()
+                                            ],
+                                            'hint': 'WebP体积更小，生成的文件为 -thumb.webp，请确认媒体服务器支持',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'thumb_width',
+                                            'label': '缩略图宽度',
+                                            'placeholder': '留空按截图方案，如 960',
+                                            'hint': '不会超过原视频的宽度',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'thumb_quality',
+                                            'label': '图片质量(1-100)',
+                                            'placeholder': '留空按截图方案，如 80',
+                                            'hint': '数值越大图片越清晰，文件也越大',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
                                 },
                                 'content': [
                                     {
                                         'component': 'VSwitch',
                                         'props': {
-                                            'model': 'enabled',
-                                            'label': '启用插件',
+                                            'model': 'thumb_cache',
+                                            'label': '缩略图缓存',
+                                            'hint': 'strm地址相同的文件直接使用已生成的图片；与媒体目录不在同一文件系统时图片会复制到插件数据目录',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSelect',
+                                        'props': {
+                                            'model': 'backend',
+                                            'label': '截图后端',
+                                            'items': [
+                                                {'title': name, 'value': key}
+                                                for key, name in THUMB_BACKENDS.items()
+                                            ],
+                                            'hint': 'PyAV在插件进程内解码并复用连接，需要安装PyAV，失败时自动使用ffmpeg命令',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'range_cache',
+                                            'label': 'Range缓存容量(MB)',
+                                            'placeholder': '0为不缓存',
+                                            'hint': '远程地址通过本地代理读取并按1MB分块缓存，超过容量时淘汰最久未使用的数据',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'thread_count',
+                                            'label': '并发数量',
+                                            'placeholder': '2',
+                                            'hint': '同时运行的ffmpeg进程数',
+                                            'persistent-hint': True
                                         }
                                     }
                                 ]
@@ -152,14 +2631,114 @@ class FFmpegStrmThumb(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
                                         'component': 'VSwitch',
                                         'props': {
-                                            'model': 'onlyonce',
-                                            'label': '立即运行一次',
+                                            'model': 'monitor',
+                                            'label': '实时监控',
+                                            'hint': '扫描路径下新增或修改strm文件后立即生成缩略图',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSelect',
+                                        'props': {
+                                            'model': 'monitor_mode',
+                                            'label': '监控模式',
+                                            'items': [
+                                                {'title': '性能模式', 'value': 'fast'},
+                                                {'title': '兼容模式', 'value': 'compatibility'}
+                                            ],
+                                            'hint': 'rclone等网络挂载目录请使用兼容模式',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'monitor_debounce',
+                                            'label': '监控防抖时间(秒)',
+                                            'placeholder': '10'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'failure_backoff',
+                                            'label': '失败重试间隔(小时)',
+                                            'placeholder': '1=168',
+                                            'hint': '1=168 表示失败1小时后重试，之后间隔翻倍，最长168小时；strm地址变化后立即重试',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'ffmpeg_timeout',
+                                            'label': 'ffmpeg超时时间(秒)',
+                                            'placeholder': '120',
+                                            'hint': '超时或插件停止时立即结束ffmpeg，超时记为失败',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'clear_failures',
+                                            'label': '清除失败记录',
                                         }
                                     }
                                 ]
@@ -168,14 +2747,94 @@ class FFmpegStrmThumb(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'transfer_event',
+                                            'label': '整理完成后生成',
+                                            'hint': '整理到扫描路径下的媒体在防抖时间后生成；也可以使用远程命令 /ffmpeg_thumb 路径',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
                                 },
                                 'content': [
                                     {
                                         'component': 'VSwitch',
                                         'props': {
-                                            'model': 'overlay',
-                                            'label': '覆盖生成',
+                                            'model': 'governor',
+                                            'label': '负载调节',
+                                            'hint': '每10秒采样系统负载和网卡流量，超过阈值时降低并发，超过两倍时暂停，负载下降后逐步恢复',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'load_limit',
+                                            'label': '每核负载阈值',
+                                            'placeholder': '如 0.8，留空不限制'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'net_limit',
+                                            'label': '网络流量阈值(Mbps)',
+                                            'placeholder': '如 200，留空不限制',
+                                            'hint': '包含缩略图生成自身的流量，请高于生成时的流量',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'pause_hours',
+                                            'label': '暂停时段',
+                                            'placeholder': '如 19:00-23:30，多个用逗号分隔',
+                                            'hint': '暂停时段内不生成缩略图',
+                                            'persistent-hint': True
                                         }
                                     }
                                 ]
@@ -188,50 +2847,66 @@ class FFmpegStrmThumb(_PluginBase):
                             {
                                 'component': 'VCol',
                                 'props': {
-                                    'cols': 12,
-                                    'md': 4
+                                    'cols': 12
                                 },
                                 'content': [
                                     {
-                                        'component': 'VTextField',
+                                        'component': 'VTextarea',
                                         'props': {
-                                            'model': 'timeline',
-                                            'label': '截取时间',
-                                            'placeholder': '00:03:01'
+                                            'model': 'scan_paths',
+                                            'label': '定时扫描路径',
+                                            'rows': 5,
+                                            'placeholder': '每一行一个目录',
+                                            'hint': '扫描中断后从断点继续，修改扫描路径或排除路径后断点失效',
+                                            'persistent-hint': True
                                         }
                                     }
                                 ]
-                            },
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
                             {
                                 'component': 'VCol',
                                 'props': {
-                                    'cols': 12,
-                                    'md': 4
+                                    'cols': 12
                                 },
                                 'content': [
                                     {
-                                        'component': 'VTextField',
+                                        'component': 'VTextarea',
                                         'props': {
-                                            'model': 'gen_strategy',
-                                            'label': '生成策略',
-                                            'placeholder': '100=60'
+                                            'model': 'exclude_paths',
+                                            'label': '定时扫描排除路径',
+                                            'rows': 2,
+                                            'placeholder': '每一行一个目录，支持通配符；不含/的规则匹配名称，如 Extras、*.sample.strm',
+                                            'hint': '* 和 ? 不跨越目录，** 匹配任意层级',
+                                            'persistent-hint': True
                                         }
                                     }
                                 ]
-                            },
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
                             {
                                 'component': 'VCol',
                                 'props': {
-                                    'cols': 12,
-                                    'md': 4
+                                    'cols': 12
                                 },
                                 'content': [
                                     {
-                                        'component': 'VTextField',
+                                        'component': 'VTextarea',
                                         'props': {
-                                            'model': 'cron',
-                                            'label': '定时扫描周期',
-                                            'placeholder': '5位cron表达式，留空关闭'
+                                            'model': 'boost_paths',
+                                            'label': '优先处理路径',
+                                            'rows': 2,
+                                            'placeholder': '每一行一个目录，支持通配符，扫描时优先处理这些路径下的文件',
+                                            'hint': '扫描按strm文件修改时间从新到旧生成，这些路径下的文件最先生成',
+                                            'persistent-hint': True
                                         }
                                     }
                                 ]
@@ -250,10 +2925,12 @@ class FFmpegStrmThumb(_PluginBase):
                                     {
                                         'component': 'VTextarea',
                                         'props': {
-                                            'model': 'scan_paths',
-                                            'label': '定时扫描路径',
-                                            'rows': 5,
-                                            'placeholder': '每一行一个目录'
+                                            'model': 'host_limits',
+                                            'label': '单主机并发数量',
+                                            'rows': 2,
+                                            'placeholder': '每一行一个主机，格式：主机=并发数量，如 115.example.com=1；*=2 表示其它远程主机的默认值',
+                                            'hint': '未配置的主机和本地文件按并发数量全速处理',
+                                            'persistent-hint': True
                                         }
                                     }
                                 ]
@@ -272,10 +2949,12 @@ class FFmpegStrmThumb(_PluginBase):
                                     {
                                         'component': 'VTextarea',
                                         'props': {
-                                            'model': 'exclude_paths',
-                                            'label': '定时扫描排除路径',
+                                            'model': 'extra_outputs',
+                                            'label': '附加输出',
                                             'rows': 2,
-                                            'placeholder': '每一行一个目录'
+                                            'placeholder': '每一行一个输出，格式：文件名后缀|截取时间|宽度，时间和宽度可留空，如 -fanart.jpg|50%|1920',
+                                            'hint': '截取时间与缩略图相近的附加输出在同一次ffmpeg中生成，相差较远时单独定位',
+                                            'persistent-hint': True
                                         }
                                     }
                                 ]
@@ -296,7 +2975,7 @@ class FFmpegStrmThumb(_PluginBase):
                                         'props': {
                                             'type': 'info',
                                             'variant': 'tonal',
-                                            'text': '默认情况下，只会生成缺失的缩略图。如果打开覆盖生成，会对所有文件重新生成缩略图。请谨慎打开。覆盖生成只对立即运行一次生效。'
+                                            'text': '默认情况下，只会生成缺失的缩略图。如果打开覆盖生成，会对所有文件重新生成缩略图。请谨慎打开。'
                                         }
                                     }
                                 ]
@@ -317,7 +2996,7 @@ class FFmpegStrmThumb(_PluginBase):
                                         'props': {
                                             'type': 'info',
                                             'variant': 'tonal',
-                                            'text': '生成策略 100=60 表示每生成100个缩略图就暂停60s，以防被风控。'
+                                            'text': '单主机限速 30=10 表示每个strm地址的主机每分钟最多生成30个缩略图，允许瞬时突发10个，以防被风控。'
                                         }
                                     }
                                 ]
@@ -333,78 +3012,886 @@ class FFmpegStrmThumb(_PluginBase):
             "scan_paths": "",
             "err_hosts": "",
             "overlay": False,
-            "gen_strategy": "100=60",
+            "dry_run": False,
+            "rate_limit": "30=10",
+            "host_limits": "",
+            "thread_count": 2,
+            "incremental": True,
+            "profile": "balanced",
+            "thumb_format": "jpg",
+            "thumb_width": "",
+            "thumb_quality": "",
+            "thumb_cache": False,
+            "backend": "ffmpeg",
+            "range_cache": 0,
+            "governor": False,
+            "load_limit": "",
+            "net_limit": "",
+            "pause_hours": "",
+            "ffmpeg_timeout": 120,
+            "failure_backoff": "1=168",
+            "clear_failures": False,
+            "extra_outputs": "",
+            "boost_paths": "",
+            "transfer_event": False,
+            "monitor": False,
+            "monitor_mode": "fast",
+            "monitor_debounce": 10,
         }
 
     def get_page(self) -> List[dict]:
-        pass
+        page = []
+        # 查询扫描进度
+        metrics = self.get_metrics().get("data")
+        if metrics.get("started"):
+            eta = metrics.get("eta")
+            scan = metrics.get("scan")
+            title = f"扫描进度（{metrics.get('state')}，开始于{metrics.get('started')}"
+            if scan.get("running"):
+                title += f"，{scan.get('trigger')}，{'覆盖生成' if scan.get('overlay') else '生成缺失'}"
+            if scan.get("pending"):
+                title += f"，完成后补充{'覆盖生成' if scan.get('pending_overlay') else '扫描'}" \
+                         f"（{'、'.join(scan.get('pending_triggers'))}）"
+            page.append(self.__build_table(
+                title=title + "）",
+                headers=["已发现", "已处理", "跳过", "缓存命中", "已生成", "失败", "队列", "文件/秒",
+                         "ffmpeg耗时P50/P95(秒)", "预计剩余"],
+                rows=[[
+                    metrics.get("seen"),
+                    metrics.get("completed"),
+                    metrics.get("skipped"),
+                    metrics.get("cached"),
+                    metrics.get("generated"),
+                    metrics.get("failed"),
+                    metrics.get("queue"),
+                    metrics.get("files_per_sec"),
+                    f'{metrics.get("ffmpeg_p50") or "-"}/{metrics.get("ffmpeg_p95") or "-"}',
+                    str(timedelta(seconds=eta)) if eta is not None else "-",
+                ]]
+            ))
+        # 负载调节状态
+        governor = metrics.get("governor")
+        if governor:
+            page.append(self.__build_table(
+                title="负载调节",
+                headers=["允许并发", "运行中", "每核负载", "网络流量(Mbps)", "状态"],
+                rows=[[
+                    f'{governor.get("allowed")}/{governor.get("max")}',
+                    governor.get("running"),
+                    governor.get("load") if governor.get("load") is not None else "-",
+                    governor.get("net_mbps") if governor.get("net_mbps") is not None else "-",
+                    governor.get("reason") or "正常",
+                ]]
+            ))
+        # 扫描预估
+        plan = self.get_data("plan")
+        if plan:
+            estimate = plan.get("estimate")
+            page.append(self.__build_table(
+                title=f"扫描预估（{plan.get('time')}，{'覆盖生成' if plan.get('overlay') else '生成缺失'}，"
+                      f"每个文件{plan.get('latency') or '-'}秒，"
+                      f"预计耗时{str(timedelta(seconds=estimate)) if estimate is not None else '未知'}）",
+                headers=["扫描路径", "全部", "排除文件", "排除目录", "已有缩略图", "缺失", "失败等待重试", "待生成"],
+                rows=[[
+                    stats.get("path"),
+                    stats.get("total"),
+                    stats.get("excluded"),
+                    stats.get("excluded_dirs", "-"),
+                    stats.get("thumbed"),
+                    stats.get("missing"),
+                    stats.get("failed"),
+                    stats.get("pending"),
+                ] for stats in plan.get("paths") + [dict(plan.get("total"), path="合计")]]
+            ))
+        # 查询限速和并发状态
+        states = self._limiter.snapshot() if self._limiter else []
+        concurrency = self._concurrency.snapshot() if self._concurrency else {}
+        for state in states:
+            state.update(concurrency.pop(state.get("host"), {}))
+        states.extend(dict(host=host, **state) for host, state in concurrency.items())
+        if states:
+            page.append(self.__build_table(
+                title="主机状态",
+                headers=["主机", "并发", "排队", "可用令牌", "等待中", "已放行", "累计等待(秒)"],
+                rows=[[
+                    state.get("host"),
+                    f'{state.get("running", 0)}/{state.get("limit") or "不限"}',
+                    state.get("parked", 0),
+                    f'{state.get("tokens", "-")}/{state.get("capacity", "-")}',
+                    state.get("waiting", 0),
+                    state.get("acquired", 0),
+                    state.get("waited", 0),
+                ] for state in states]
+            ))
+        # 查询失败记录
+        failures = self._index.list_failures() if self._index else []
+        if failures:
+            page.append(self.__build_table(
+                title=f"失败记录（共{self._index.count_failures()}条，在插件配置中打开清除失败记录可立即重试）",
+                headers=["文件", "失败次数", "下次重试", "错误信息"],
+                rows=[[
+                    failure.get("path"),
+                    failure.get("count"),
+                    datetime.fromtimestamp(failure.get("next_retry")).strftime('%Y-%m-%d %H:%M:%S'),
+                    failure.get("error"),
+                ] for failure in failures]
+            ))
+        if not page:
+            return [
+                {
+                    'component': 'div',
+                    'text': '暂无数据',
+                    'props': {
+                        'class': 'text-center',
+                    }
+                }
+            ]
+        return page
+
+    @staticmethod
+    def __build_table(title: str, headers: List[str], rows: List[List[Any]]) -> dict:
+        """
+        拼装数据表格
+        """
+        return {
+            'component': 'VRow',
+            'content': [
+                {
+                    'component': 'VCol',
+                    'props': {
+                        'cols': 12,
+                    },
+                    'content': [
+                        {
+                            'component': 'div',
+                            'props': {
+                                'class': 'text-subtitle-1 ps-4'
+                            },
+                            'text': title
+                        },
+                        {
+                            'component': 'VTable',
+                            'props': {
+                                'hover': True
+                            },
+                            'content': [
+                                {
+                                    'component': 'thead',
+                                    'content': [
+                                        {
+                                            'component': 'th',
+                                            'props': {
+                                                'class': 'text-start ps-4'
+                                            },
+                                            'text': header
+                                        } for header in headers
+                                    ]
+                                },
+                                {
+                                    'component': 'tbody',
+                                    'content': [
+                                        {
+                                            'component': 'tr',
+                                            'props': {
+                                                'class': 'text-sm'
+                                            },
+                                            'content': [
+                                                {
+                                                    'component': 'td',
+                                                    'props': {
+                                                        'class': 'whitespace-nowrap break-keep text-high-emphasis'
+                                                    },
+                                                    'text': row[0]
+                                                }
+                                            ] + [
+                                                {
+                                                    'component': 'td',
+                                                    'text': value
+                                                } for value in row[1:]
+                                            ]
+                                        } for row in rows
+                                    ]
+                                }
+                            ]
+                        }
+                    ]
+                }
+            ]
+        }
 
-    def __libraryscan(self, is_overlay=False):
+    def __libraryscan(self, is_overlay=False, trigger: str = "定时任务"):
         """
-        开始扫描媒体库
+        开始扫描媒体库，已有扫描在运行时合并为其完成后的一次补充扫描
         """
         if not self._scan_paths:
             return
+        if not self._coordinator.begin(is_overlay, trigger):
+            logger.info(f"FFmpegStrm缩略图已有扫描正在进行，{trigger}将在当前扫描完成后补充扫描")
+            return
+        finished = False
+        try:
+            while True:
+                self.__scan(is_overlay)
+                if self._event.is_set():
+                    return
+                is_overlay = self._coordinator.next()
+                if is_overlay is None:
+                    finished = True
+                    return
+                logger.info(f"FFmpegStrm缩略图开始补充扫描，触发：{self._coordinator.trigger}")
+        finally:
+            if not finished:
+                self._coordinator.cancel()
+
+    def __scan(self, is_overlay: bool):
+        """
+        扫描媒体库
+        """
         # 排除目录
-        exclude_paths = self._exclude_paths.split("\n")
+        exclude = ExcludeMatcher(self._exclude_paths.split("\n"))
         # 已选择的目录
         paths = self._scan_paths.split("\n")
-        for path in paths:
+        # 扫描断点
+        checkpoint = None
+        if self._index:
+            checkpoint = ScanCheckpoint(self._index, ScanCheckpoint.fingerprint(
+                self._scan_paths, self._exclude_paths, is_overlay))
+            if checkpoint.finished:
+                logger.info(f"FFmpegStrm缩略图从断点继续扫描，跳过{len(checkpoint.finished)}个已完成的目录")
+        # 按修改时间从新到旧处理的任务队列
+        queue = self.__get_queue()
+        if queue is None:
+            return
+        # 本次扫描加入队列但尚未完成的文件
+        pending = TaskCounter()
+
+        def done(file_path: Path):
+            self._metrics.incr("completed")
+            if checkpoint:
+                checkpoint.done(file_path)
+            pending.done()
+
+        self._metrics.start()
+        try:
+            try:
+                for path in paths:
+                    if not path:
+                        continue
+                    scan_path = Path(path)
+                    if not scan_path.exists():
+                        logger.warning(f"FFmpegStrm缩略图扫描路径不存在：{path}")
+                        continue
+                    logger.info(f"开始FFmpegStrm缩略图扫描：{path} ...")
+                    # 遍历目录下的所有文件
+                    for file_path, mtime, listing in self.__list_strm_files(scan_path, is_overlay, exclude,
+                                                                            checkpoint):
+                        if checkpoint:
+                            checkpoint.add(file_path)
+                        pending.add()
+                        if self._event.is_set() or not queue.put(
+                                file_path, mtime, partial(self.gen_file_thumb, file_path, is_overlay, done, listing),
+                                self._event):
+                            logger.info(f"FFmpegStrm缩略图扫描服务停止")
+                            return
+                        self._metrics.incr("seen")
+                    logger.info(f"目录 {path} 扫描完成")
+            finally:
+                self._metrics.walk_done()
+            if not pending.wait(self._event):
+                logger.info(f"FFmpegStrm缩略图扫描服务停止")
+                return
+        finally:
+            self._metrics.finish()
+            latency = self._metrics.mean_latency()
+            if latency and self._index:
+                # 记录实测的ffmpeg耗时，用于扫描预估
+                self._index.set_meta("latency", f"{latency:.3f}")
+        if checkpoint and not self._event.is_set():
+            checkpoint.complete()
+        if self._cache and not self._event.is_set():
+            count = self._cache.prune(30 * 24 * 3600)
+            if count:
+                logger.info(f"FFmpegStrm缩略图已清理{count}个过期缓存")
+
+    def __start_monitor(self):
+        """
+        启动扫描路径的目录监控
+        """
+        self._monitor_stop.clear()
+        for path in self._scan_paths.split("\n"):
             if not path:
                 continue
-            scan_path = Path(path)
-            if not scan_path.exists():
-                logger.warning(f"FFmpegStrm缩略图扫描路径不存在：{path}")
+            if not Path(path).exists():
+                logger.warning(f"FFmpegStrm缩略图监控路径不存在：{path}")
                 continue
-            logger.info(f"开始FFmpegStrm缩略图扫描：{path} ...")
-            # 遍历目录下的所有文件
-            for file_path in SystemUtils.list_files(scan_path, extensions=['.strm']):
-                if self._event.is_set():
-                    logger.info(f"FFmpegStrm缩略图扫描服务停止")
+            try:
+                if self._monitor_mode == "compatibility":
+                    # 兼容模式，目录同步性能降低且NAS不能休眠，但可以兼容挂载的远程共享目录如SMB、rclone
+                    observer = PollingObserver(timeout=10)
+                else:
+                    # 内部处理系统操作类型选择最优解
+                    observer = Observer(timeout=10)
+                observer.schedule(StrmFileHandler(self.__on_file_changed), path=path, recursive=True)
+                observer.daemon = True
+                observer.start()
+                self._observers.append(observer)
+                logger.info(f"FFmpegStrm缩略图开始监控目录：{path}，模式：{self._monitor_mode}")
+            except Exception as e:
+                err_msg = str(e)
+                if "inotify" in err_msg and "reached" in err_msg:
+                    logger.warning(f"FFmpegStrm缩略图监控目录 {path} 失败，inotify监控数量已达上限，"
+                                   f"请调整 fs.inotify.max_user_watches 或使用兼容模式")
+                else:
+                    logger.error(f"FFmpegStrm缩略图监控目录 {path} 失败：{err_msg}")
+                self.systemmessage.put(f"FFmpegStrm缩略图监控目录 {path} 失败：{err_msg}", title="FFmpegStrm缩略图")
+        threading.Thread(target=self.__monitor_flush, name="FFmpegStrmThumbMonitorFlush", daemon=True).start()
+
+    def __on_file_changed(self, file_path: str):
+        """
+        记录变化的strm文件，等待防抖时间后再处理
+        """
+        if not file_path.lower().endswith(".strm"):
+            return
+        with self._monitor_lock:
+            self._monitor_files[file_path] = time.time()
+
+    def __monitor_flush(self):
+        """
+        将防抖时间内没有再变化的文件加入任务队列，与扫描共用工作线程
+        """
+        exclude = ExcludeMatcher(self._exclude_paths.split("\n"))
+        while not self._monitor_stop.wait(1):
+            deadline = time.time() - self._monitor_debounce
+            with self._monitor_lock:
+                ready = [path for path, changed in self._monitor_files.items() if changed <= deadline]
+                for path in ready:
+                    self._monitor_files.pop(path)
+            for path in ready:
+                file_path = Path(path)
+                if not file_path.exists() or exclude.match(file_path):
+                    continue
+                logger.info(f"FFmpegStrm缩略图监控到文件变化：{path}")
+                if not self.__queue_file(file_path, False):
+                    # 监控已停止
                     return
-                # 排除目录
-                exclude_flag = False
-                for exclude_path in exclude_paths:
-                    try:
-                        if file_path.is_relative_to(Path(exclude_path)):
-                            exclude_flag = True
-                            break
-                    except Exception as err:
-                        print(str(err))
-                if exclude_flag:
-                    logger.debug(f"{file_path} 在排除目录中，跳过 ...")
+
+    def __stop_monitor(self):
+        """
+        停止目录监控
+        """
+        self._monitor_stop.set()
+        for observer in self._observers:
+            try:
+                observer.stop()
+                observer.join()
+            except Exception as e:
+                logger.error(f"FFmpegStrm缩略图停止目录监控失败：{str(e)}")
+        self._observers = []
+        with self._monitor_lock:
+            self._monitor_files.clear()
+
+    def __list_strm_files(self, scan_path: Path, is_overlay: bool, exclude: ExcludeMatcher,
+                          checkpoint: ScanCheckpoint = None) -> Iterator[Tuple[Path, float, Optional[Set[str]]]]:
+        """
+        遍历目录下的strm文件，开启增量扫描时跳过未变化的目录，只返回新增、变化或未成功生成的文件
+        排除的目录不会进入遍历，断点中已完成的目录只遍历其子目录
+        返回文件路径、修改时间和所在目录的文件名，目录的文件名只读取一次，用于判断图片是否已存在
+        未开启增量扫描时修改时间为所在目录的修改时间，不逐个查询文件
+        """
+        if exclude.match(scan_path):
+            logger.debug(f"{scan_path} 在排除目录中，跳过 ...")
+            return
+        index = self._index if self._incremental else None
+        # 待遍历的目录栈，逐个目录边遍历边返回文件，不预先生成完整的文件列表
+        dirs = [scan_path]
+        while dirs:
+            if self._event.is_set():
+                return
+            directory = dirs.pop()
+            if checkpoint and checkpoint.is_finished(directory):
+                dirs.extend(self.__prune_dirs(directory, reversed(self.__list_subdirs(directory)), exclude))
+                continue
+            try:
+                dir_mtime = directory.stat().st_mtime
+                cached = index.get_dir(str(directory)) if index else None
+                if cached and not is_overlay and cached[0] == dir_mtime:
+                    # 目录未变化，只处理未成功生成的文件
+                    for file_path, (mtime, _, state) in sorted(index.get_files(str(directory)).items()):
+                        if state != ThumbIndex.STATE_DONE and not exclude.match_file(Path(file_path)):
+                            yield Path(file_path), mtime, None
+                    dirs.extend(self.__prune_dirs(directory, reversed(cached[1]), exclude))
+                    if checkpoint:
+                        checkpoint.listed(directory)
                     continue
-                # 开始处理文件
-                self.gen_file_thumb(file_path, is_overlay)
-            logger.info(f"目录 {path} 扫描完成")
+                names = set()
+                subdirs = []
+                files: List[os.DirEntry] = []
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        names.add(entry.name)
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        elif entry.name.lower().endswith(".strm") and not exclude.match_file(Path(entry.path)):
+                            files.append(entry)
+                subdirs.sort()
+                files.sort(key=lambda e: e.name)
+            except OSError as err:
+                logger.warning(f"FFmpegStrm缩略图扫描目录 {directory} 失败：{str(err)}")
+                continue
+            dirs.extend(self.__prune_dirs(directory, reversed(subdirs), exclude))
+            if not index:
+                # 未开启增量扫描时不逐个查询文件，使用目录的修改时间排序
+                for entry in files:
+                    yield Path(entry.path), dir_mtime, names
+                if checkpoint:
+                    checkpoint.listed(directory)
+                continue
+            known = index.get_files(str(directory))
+            records = []
+            for entry in files:
+                # 增量扫描需要文件的修改时间和大小判断是否变化
+                stat = entry.stat()
+                records.append((entry.path, stat.st_mtime, stat.st_size))
+            index.update_dir(str(directory), dir_mtime, subdirs, records)
+            for entry, (path, mtime, size) in zip(files, records):
+                old = known.get(path)
+                if old and old[2] == ThumbIndex.STATE_DONE and old[:2] == (mtime, size):
+                    if not is_overlay and all(name in names for name in self.__output_names(Path(path))):
+                        continue
+                    # 缩略图已被删除或需要覆盖，重新标记为待处理
+                    index.set_state(path, ThumbIndex.STATE_PENDING)
+                yield Path(path), mtime, names
+            if checkpoint:
+                checkpoint.listed(directory)
+
+    def __list_subdirs(self, directory: Path) -> List[str]:
+        """
+        获取子目录名称，优先使用扫描索引
+        """
+        cached = self._index.get_dir(str(directory)) if self._index else None
+        if cached:
+            return cached[1]
+        try:
+            with os.scandir(directory) as entries:
+                return sorted(entry.name for entry in entries if entry.is_dir(follow_symlinks=False))
+        except OSError as err:
+            logger.warning(f"FFmpegStrm缩略图扫描目录 {directory} 失败：{str(err)}")
+            return []
+
+    @staticmethod
+    def __prune_dirs(directory: Path, names, exclude: ExcludeMatcher) -> List[Path]:
+        """
+        过滤掉排除的子目录
+        """
+        subdirs = []
+        for name in names:
+            subdir = directory / name
+            if exclude.match(subdir):
+                logger.debug(f"{subdir} 在排除目录中，跳过 ...")
+                continue
+            subdirs.append(subdir)
+        return subdirs
+
+    def gen_file_thumb(self, file_path: Path, is_overlay, callback: Callable[[Path], None] = None,
+                       listing: Set[str] = None):
+        """
+        处理一个文件，处理完成（含跳过和失败）后调用callback
+        listing为遍历时所在目录的文件名，有则直接判断图片是否存在，不再逐个查询文件系统
+        同一文件正在处理时忽略重复的触发
+        """
+        if self._event.is_set():
+            return
+        with self._inflight_lock:
+            duplicate = str(file_path) in self._inflight
+            self._inflight.add(str(file_path))
+        if duplicate:
+            logger.debug(f"{file_path} 正在生成缩略图，忽略重复的触发")
+            self._metrics.incr("skipped")
+            self.__finish(file_path, callback, release=False)
+            return
+        try:
+            thumb_path = file_path.with_name(self.__thumb_name(file_path))
+            outputs = [(str(thumb_path), self._timeline, None)] + [
+                (str(file_path.with_name(file_path.stem + suffix)), timeline or self._timeline, width)
+                for suffix, timeline, width in self._outputs
+            ]
+            if not is_overlay:
+                # 只生成缺失的图片
+                if listing is not None:
+                    outputs = [output for output in outputs if Path(output[0]).name not in listing]
+                else:
+                    outputs = [output for output in outputs if not Path(output[0]).exists()]
+                if not outputs:
+                    logger.debug(f"缩略图已存在：{thumb_path}")
+                    self.__set_index_state(file_path, ThumbIndex.STATE_DONE)
+                    self._metrics.incr("skipped")
+                    self.__finish(file_path, callback)
+                    return
+            with open(file_path, 'r', encoding='utf-8') as file:
+                strm_path = file.read()
+            if not is_overlay and self._cache:
+                # 优先使用相同strm地址已生成的图片
+                outputs = [output for output in outputs
+                           if not self._cache.get(self.__cache_key(strm_path, *output), output[0])]
+                if not outputs:
+                    logger.info(f"{file_path} 缩略图已从缓存生成：{thumb_path}")
+                    self.__set_index_state(file_path, ThumbIndex.STATE_DONE, strm_path)
+                    self._metrics.incr("cached")
+                    self.__finish(file_path, callback)
+                    return
+            if self.__in_backoff(file_path, strm_path):
+                self._metrics.incr("skipped")
+                self.__finish(file_path, callback)
+                return
+        except Exception as err:
+            logger.error(f"FFmpegStrm处理文件 {file_path} 时发生错误：{str(err)}")
+            self.__set_index_state(file_path, ThumbIndex.STATE_FAILED)
+            self._metrics.incr("failed")
+            self.__finish(file_path, callback)
+            return
+        host = self.__get_host(strm_path)
+        task = partial(self.__run_on_host, host, partial(self.__gen_thumb, file_path, outputs, strm_path, callback,
+                                                         not is_overlay and self._cache is not None))
+        wait = self._limiter.reserve(host)
+        if wait > 0:
+            queue = self._queue
+            if queue is not None:
+                # 触发主机限速时暂缓任务，工作线程继续处理其它主机和本地文件
+                queue.delay(task, wait)
+                return
+            if self._event.wait(wait):
+                return
+        task()
+
+    def __run_on_host(self, host: Optional[str], task: Callable[[], None]) -> bool:
+        """
+        在主机的并发限制内执行任务，名额已满时暂存，由释放名额的线程接着执行
+        返回False表示任务已暂存
+        """
+        if not self._concurrency.acquire(host, task):
+            return False
+        # 处理完成后继续处理该主机暂存的任务
+        while task:
+            task()
+            task = self._concurrency.release(host)
+        return True
 
-    def gen_file_thumb(self, file_path: Path, is_overlay):
+    def __gen_thumb(self, file_path: Path, outputs: List[Tuple[str, str, Optional[int]]], strm_path: str,
+                    callback: Optional[Callable[[Path], None]], use_cache: bool):
         """
-        处理一个文件
+        生成一个文件的缩略图
+        使用缓存时先认领缓存键，相同缓存键正在由其它文件生成时暂存本任务并返回，不占用工作线程，
+        其它文件生成完成后由该线程接着处理，直接使用缓存的图片
         """
-        # 单线程处理
-        with ffmpeg_lock:
+        claimed = []
+        if use_cache and not self._event.is_set():
             try:
-                if not is_overlay:
-                    thumb_path = file_path.with_name(
-                        file_path.stem + "-thumb.jpg")
-                    if thumb_path.exists():
-                        logger.debug(f"缩略图已存在：{thumb_path}")
+                outputs = [output for output in outputs
+                           if not self._cache.get(self.__cache_key(strm_path, *output), output[0])]
+                if outputs:
+                    claimed = self.__claim_cache(strm_path, outputs, partial(
+                        self.__gen_thumb, file_path, outputs, strm_path, callback, use_cache))
+                    if claimed is None:
                         return
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    strm_path = file.read()
-                self._gen_strategy_count += 1
-                if self._gen_strategy_count > self._gen_strategy_max_count:
-                    logger.info(f"暂停{self._gen_strategy_delay}秒...")
-                    time.sleep(self._gen_strategy_delay)
-                    self._gen_strategy_count = 0  # 重置计数器
-                if self.get_thumb(strm_path=str(strm_path),
-                                  image_path=str(thumb_path), frames=self._timeline):
-                    logger.info(f"{file_path} 缩略图已生成：{thumb_path}")
             except Exception as err:
-                logger.error(f"FFmpegStrm处理文件 {file_path} 时发生错误：{str(err)}")
+                logger.error(f"FFmpegStrm缩略图读取缓存 {file_path} 时发生错误：{str(err)}")
+        followers = []
+        try:
+            if not outputs:
+                logger.info(f"{file_path} 缩略图已从缓存生成：{file_path.with_name(self.__thumb_name(file_path))}")
+                self.__set_index_state(file_path, ThumbIndex.STATE_DONE, strm_path)
+                self._metrics.incr("cached")
+            elif not self._event.is_set():
+                self.__generate(file_path, outputs, strm_path)
+        finally:
+            followers = self.__release_cache(claimed)
+            self.__finish(file_path, callback)
+        for follower in followers:
+            follower()
+
+    def __claim_cache(self, strm_path: str, outputs: List[Tuple[str, str, Optional[int]]],
+                      retry: Callable[[], None]) -> Optional[List[str]]:
+        """
+        认领缓存键的生成，返回认领的缓存键
+        相同缓存键正在由其它文件生成时暂存retry，生成完成后再处理，返回None
+        """
+        keys = [self.__cache_key(strm_path, *output) for output in outputs]
+        with self._inflight_lock:
+            for key in keys:
+                if key in self._cache_inflight:
+                    self._cache_inflight[key].append(retry)
+                    return None
+            for key in keys:
+                self._cache_inflight[key] = []
+        return keys
+
+    def __release_cache(self, keys: List[str]) -> List[Callable[[], None]]:
+        """
+        缓存键生成完成，返回等待这些缓存键的任务
+        """
+        followers = []
+        with self._inflight_lock:
+            for key in keys:
+                followers.extend(self._cache_inflight.pop(key, None) or [])
+        return followers
+
+    def __finish(self, file_path: Path, callback: Optional[Callable[[Path], None]], release: bool = True):
+        """
+        文件处理完成，服务停止时不回调
+        """
+        if release:
+            with self._inflight_lock:
+                self._inflight.discard(str(file_path))
+        if callback and not self._event.is_set():
+            try:
+                callback(file_path)
+            except Exception as err:
+                logger.error(f"FFmpegStrm缩略图处理完成回调出错：{str(err)}")
+
+    def __generate(self, file_path: Path, outputs: List[Tuple[str, str, Optional[int]]], strm_path: str):
+        """
+        调用ffmpeg生成图片，记录结果
+        """
+        try:
+            governor = self._governor
+            if governor and not governor.acquire(self._event):
+                return
+            self._thread_state.error = None
+            start = time.monotonic()
+            try:
+                success = self.get_thumbs(strm_path=str(strm_path), outputs=outputs)
+            finally:
+                if governor:
+                    governor.release()
+            if self._event.is_set():
+                return
+            self._metrics.add_latency(time.monotonic() - start)
+            # 部分图片失败时，已生成的图片同样保留和缓存，下次只生成缺少的图片
+            generated = [output for output in outputs if output[0] in self._thread_state.generated]
+            if self._cache:
+                for output in generated:
+                    self._cache.put(self.__cache_key(strm_path, *output), output[0])
+            if success:
+                logger.info(f"{file_path} 缩略图已生成：{'、'.join(output[0] for output in outputs)}")
+                self.__set_index_state(file_path, ThumbIndex.STATE_DONE, strm_path)
+                self._metrics.incr("generated")
+                if self._index:
+                    self._index.clear_failures(str(file_path))
+            else:
+                if generated:
+                    logger.info(f"{file_path} 部分缩略图已生成：{'、'.join(output[0] for output in generated)}")
+                self.__set_index_state(file_path, ThumbIndex.STATE_FAILED, strm_path)
+                self._metrics.incr("failed")
+                self.__add_failure(file_path, strm_path, self._thread_state.error or "生成失败")
+        except Exception as err:
+            logger.error(f"FFmpegStrm处理文件 {file_path} 时发生错误：{str(err)}")
+            self.__set_index_state(file_path, ThumbIndex.STATE_FAILED)
+            self._metrics.incr("failed")
+            self.__add_failure(file_path, strm_path, str(err))
+
+    def __in_backoff(self, file_path: Path, strm_path: str) -> bool:
+        """
+        判断文件是否在失败重试间隔内
+        """
+        if not self._index:
+            return False
+        failure = self._index.get_failure(str(file_path))
+        if not failure:
+            return False
+        target, count, next_retry = failure
+        if target != strm_path.strip() or next_retry <= time.time():
+            return False
+        logger.debug(f"{file_path} 已失败{count}次，"
+                     f"{datetime.fromtimestamp(next_retry).strftime('%Y-%m-%d %H:%M:%S')} 后重试")
+        return True
+
+    def __add_failure(self, file_path: Path, strm_path: str, error: str):
+        """
+        记录失败，计算下次重试时间
+        """
+        if not self._index:
+            return
+        try:
+            base, limit = (float(value) * 3600 for value in self._failure_backoff.split("="))
+        except ValueError:
+            base, limit = 3600, 168 * 3600
+        try:
+            count, next_retry = self._index.add_failure(str(file_path), strm_path.strip(),
+                                                        error[-500:], base, limit)
+            logger.info(f"{file_path} 已失败{count}次，"
+                        f"{datetime.fromtimestamp(next_retry).strftime('%Y-%m-%d %H:%M:%S')} 后重试")
+        except Exception as err:
+            logger.error(f"FFmpegStrm缩略图记录失败信息出错：{str(err)}")
+
+    def __resolve_timelines(self, strm_path: str, outputs: List[Tuple[str, str, Optional[int]]]) \
+            -> List[Tuple[str, str, Optional[int]]]:
+        """
+        将百分比截取时间按视频时长换算为秒数，时长已知时避免截取时间超出视频长度
+        """
+        outputs = [(image_path, str(frames or "00:03:01").strip(), width) for image_path, frames, width in outputs]
+        need_probe = any(frames.endswith("%") for _, frames, _ in outputs)
+        duration = self.get_duration(strm_path, probe=need_probe)
+        if not duration:
+            if need_probe:
+                logger.warning(f"{strm_path.strip()} 获取视频时长失败，使用默认截取时间 00:03:01")
+            return [(image_path, "00:03:01" if frames.endswith("%") else frames, width)
+                    for image_path, frames, width in outputs]
+        resolved = []
+        for image_path, frames, width in outputs:
+            if frames.endswith("%"):
+                seconds = duration * float(frames[:-1]) / 100
+            else:
+                seconds = self.__parse_time(frames)
+            # 截取时间超出视频长度时取视频中间
+            if seconds >= duration:
+                seconds = duration / 2
+            resolved.append((image_path, f"{seconds:.3f}", width))
+        return resolved
+
+    def get_duration(self, strm_path: str, probe: bool = True) -> Optional[float]:
+        """
+        获取视频时长，优先使用缓存，缓存没有时使用ffprobe探测并缓存
+        """
+        target = strm_path.strip()
+        if self._index:
+            duration = self._index.get_duration(target)
+            if duration or not probe:
+                return duration
+        elif not probe:
+            return None
+        output = self.execute(["ffprobe", "-v", "error", "-show_entries", "format=duration",
+                               "-of", "default=noprint_wrappers=1:nokey=1", self.__source_url(target)])
+        try:
+            duration = float(output)
+        except (TypeError, ValueError):
+            return None
+        if duration <= 0:
+            return None
+        if self._index:
+            self._index.set_duration(target, duration)
+        return duration
+
+    def __set_index_state(self, file_path: Path, state: str, target: str = None):
+        """
+        更新扫描索引中的缩略图状态
+        """
+        if not self._index:
+            return
+        try:
+            self._index.set_state(str(file_path), state, target.strip() if target else None)
+        except Exception as err:
+            logger.error(f"FFmpegStrm缩略图更新扫描索引失败：{str(err)}")
+
+    def __build_governor(self) -> LoadGovernor:
+        """
+        解析负载调节配置
+        """
+        try:
+            load_limit = float(self._load_limit) if self._load_limit else None
+        except ValueError:
+            logger.error(f"FFmpegStrm缩略图负载阈值配置错误：{self._load_limit}")
+            load_limit = None
+        try:
+            net_limit = float(self._net_limit) if self._net_limit else None
+        except ValueError:
+            logger.error(f"FFmpegStrm缩略图流量阈值配置错误：{self._net_limit}")
+            net_limit = None
+        return LoadGovernor(self._thread_count, load_limit, net_limit, LoadGovernor.parse_hours(self._pause_hours))
+
+    def __build_concurrency(self) -> HostConcurrency:
+        """
+        解析单主机并发数量配置
+        """
+        limits = {}
+        default = 0
+        for line in self._host_limits.split("\n"):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                host, limit = line.rsplit("=", 1)
+                host = host.strip().lower()
+                if host == "*":
+                    default = max(int(limit), 0)
+                else:
+                    limits[host] = max(int(limit), 0)
+            except ValueError:
+                logger.error(f"FFmpegStrm缩略图单主机并发数量配置错误：{line}")
+        return HostConcurrency(limits=limits, default=default)
+
+    def __parse_outputs(self) -> List[Tuple[str, Optional[str], Optional[int]]]:
+        """
+        解析附加输出配置
+        """
+        outputs = []
+        for line in self._extra_outputs.split("\n"):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            suffix, timeline, width = (line.split("|") + ["", ""])[:3]
+            if timeline.strip() and not self.__is_valid_time(timeline):
+                logger.error(f"FFmpegStrm缩略图附加输出截取时间配置错误：{line}，使用缩略图的截取时间")
+                timeline = ""
+            try:
+                outputs.append((suffix.strip(), timeline.strip() or None,
+                                int(width) if width.strip() else None))
+            except ValueError:
+                logger.error(f"FFmpegStrm缩略图附加输出配置错误：{line}")
+        return outputs
+
+    def __is_valid_time(self, timeline: str) -> bool:
+        """
+        检查截取时间配置：时:分:秒、秒数或0-100的百分比
+        """
+        timeline = str(timeline).strip()
+        try:
+            if timeline.endswith("%"):
+                return 0 <= float(timeline[:-1]) <= 100
+            return 0 <= self.__parse_time(timeline) < float("inf")
+        except ValueError:
+            return False
+
+    @staticmethod
+    def __parse_time(timeline: str) -> float:
+        """
+        将 时:分:秒 或秒数转换为秒数
+        """
+        seconds = 0.0
+        for part in str(timeline).strip().split(":"):
+            seconds = seconds * 60 + float(part)
+        return seconds
+
+    @staticmethod
+    def __get_host(strm_path: str) -> Optional[str]:
+        """
+        获取strm地址的主机名，本地文件返回None
+        """
+        url = urlparse(strm_path.strip())
+        if url.scheme in ("http", "https"):
+            return url.hostname
+        return None
+
+    def __cache_key(self, strm_path: str, image_path: str, timeline: str, width: Optional[int]) -> str:
+        """
+        缩略图缓存的键：strm地址、截取时间、截图方案和编码参数
+        """
+        options = FFMPEG_PROFILES.get(self._profile) or FFMPEG_PROFILES["balanced"]
+        return ThumbCache.key(strm_path.strip(), timeline, width or self._thumb_width or options["width"],
+                              options["input"], self.__encode_args(image_path, options))
+
+    def __output_names(self, file_path: Path) -> List[str]:
+        """
+        strm文件对应的缩略图和附加输出的文件名
+        """
+        return [self.__thumb_name(file_path)] + [file_path.stem + suffix for suffix, _, _ in self._outputs]
+
+    def __thumb_name(self, file_path: Path) -> str:
+        """
+        strm文件对应的缩略图文件名
+        """
+        return f"{file_path.stem}-thumb.{self._thumb_format}"
 
-    def get_thumb(self, strm_path: str, image_path: str, frames: str = None):
+    def get_thumb(self, strm_path: str, image_path: str, frames: str = None, profile: str = None):
         """
         使用ffmpeg从视频文件中截取缩略图
         """
@@ -412,42 +3899,425 @@ class FFmpegStrmThumb(_PluginBase):
             frames = "00:03:01"
         if not strm_path or not image_path:
             return False
-        cmd = 'ffmpeg -ss {frames} -i "{strm_path}" -vframes 1 -f image2 "{image_path}"'.format(strm_path=strm_path,
-                                                                                                frames=frames,
-                                                                                                image_path=image_path)
-        result = self.execute(cmd)
-        if result:
+        return self.get_thumbs(strm_path=strm_path, outputs=[(image_path, frames, None)], profile=profile)
+
+    def get_thumbs(self, strm_path: str, outputs: List[Tuple[str, str, Optional[int]]], profile: str = None):
+        """
+        使用ffmpeg从视频文件中截取多张图片，outputs为[(图片路径, 截取时间, 宽度)]
+        截取时间相近的图片在一次定位中按各自的时间偏移输出，相差较远的分别定位
+        部分图片失败时保留已生成的图片，记录在线程状态的generated中，全部生成时返回True
+        """
+        self._thread_state.generated = []
+        if not strm_path or not outputs:
+            return False
+        options = FFMPEG_PROFILES.get(profile or self._profile) or FFMPEG_PROFILES["balanced"]
+        deadline = time.monotonic() + self._ffmpeg_timeout
+        if self._backend == "pyav" and av and self.__get_host(strm_path) not in self._range_unsupported:
+            generated = self.__pyav_thumbs(strm_path, outputs, options, deadline)
+            self._thread_state.generated.extend(generated)
+            outputs = [output for output in outputs if output[0] not in generated]
+            if not outputs:
+                return True
+            if self._event.is_set():
+                return False
+            logger.debug(f"{strm_path.strip()} PyAV截图失败，使用ffmpeg命令：{self._thread_state.error}")
+        outputs = self.__resolve_timelines(strm_path, outputs)
+        seconds = [self.__parse_time(frames or "00:03:01") for _, frames, _ in outputs]
+        groups: List[List[int]] = []
+        for i in sorted(range(len(outputs)), key=lambda i: seconds[i]):
+            if groups and seconds[i] - seconds[groups[-1][0]] <= THUMB_MERGE_WINDOW:
+                groups[-1].append(i)
+            else:
+                groups.append([i])
+        # 缩略图所在的分组最先生成
+        groups.sort(key=lambda group: 0 if 0 in group else 1)
+        success = True
+        for group in groups:
+            remaining = deadline - time.monotonic()
+            if self._event.is_set() or remaining <= 0:
+                return False
+            if self.__ffmpeg_thumbs(strm_path, [outputs[i] for i in group], [seconds[i] for i in group],
+                                    options, remaining):
+                self._thread_state.generated.extend(outputs[i][0] for i in group)
+            else:
+                success = False
+        return success
+
+    def __ffmpeg_thumbs(self, strm_path: str, outputs: List[Tuple[str, str, Optional[int]]], seconds: List[float],
+                        options: dict, timeout: float) -> bool:
+        """
+        使用一次ffmpeg定位到最早的截取时间，按各自的时间偏移输出多张图片
+        """
+        start = min(seconds)
+        cmd = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+               *options["input"], "-ss", f"{start:.3f}", "-i", self.__source_url(strm_path)]
+        filters = []
+        if len(outputs) > 1:
+            filters.append(f"[0:v:0]split={len(outputs)}" + "".join(f"[s{i}]" for i in range(len(outputs))))
+        for i, ((image_path, _, width), offset) in enumerate(zip(outputs, seconds)):
+            chain = []
+            if offset > start:
+                chain.append(f"trim=start={offset - start:.3f}")
+            width = width or self._thumb_width or options["width"]
+            if width:
+                chain.append(f"scale='min({width},iw)':-2")
+            source = f"[s{i}]" if len(outputs) > 1 else "[0:v:0]"
+            filters.append(source + (",".join(chain) or "null") + f"[o{i}]")
+        cmd += ["-filter_complex", ";".join(filters)]
+        # 先写入同目录的临时文件，全部成功后再替换，避免媒体服务器读到未写完的图片
+        temp_paths = [self.__temp_path(image_path) for image_path, _, _ in outputs]
+        for i, ((image_path, _, _), temp_path) in enumerate(zip(outputs, temp_paths)):
+            cmd += ["-map", f"[o{i}]", "-an", "-sn", "-dn", "-frames:v", "1",
+                    *self.__encode_args(image_path, options), "-f", "image2", "-update", "1", "-y", temp_path]
+        try:
+            if self.execute(cmd, timeout=timeout) is None:
+                return False
+            if not all(Path(temp_path).exists() for temp_path in temp_paths):
+                return False
+            for (image_path, _, _), temp_path in zip(outputs, temp_paths):
+                os.replace(temp_path, image_path)
             return True
-        return False
+        finally:
+            for temp_path in temp_paths:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def __pyav_thumbs(self, strm_path: str, outputs: List[Tuple[str, str, Optional[int]]], options: dict,
+                      deadline: float) -> List[str]:
+        """
+        使用PyAV在进程内截取图片，远程地址通过主机的连接池分块读取，返回已生成的图片路径
+        """
+        target = strm_path.strip()
+        host = self.__get_host(target)
+        source = HttpRangeReader(self.__get_session(host), self.__source_url(target), deadline, self._event) \
+            if host else target
+        generated: List[str] = []
+        temp_path = None
+        try:
+            with av.open(source, mode="r") as container:
+                stream = container.streams.video[0]
+                if "nokey" in options["input"]:
+                    stream.codec_context.skip_frame = "NONKEY"
+                accurate = "-noaccurate_seek" not in options["input"]
+                # 缓存视频时长，百分比截取时间不再调用ffprobe
+                if container.duration and self._index and not self._index.get_duration(target):
+                    self._index.set_duration(target, container.duration / av.time_base)
+                for image_path, frames, width in self.__resolve_timelines(strm_path, outputs):
+                    seconds = self.__parse_time(frames)
+                    container.seek(int(seconds / stream.time_base), stream=stream, backward=True)
+                    frame = None
+                    for frame in container.decode(stream):
+                        if self._event.is_set() or time.monotonic() > deadline:
+                            raise TimeoutError("解码超时或服务停止")
+                        if not accurate or frame.time is None or frame.time >= seconds:
+                            break
+                    if frame is None:
+                        raise IOError(f"{frames} 没有可用的视频帧")
+                    image = frame.to_image()
+                    width = width or self._thumb_width or options["width"]
+                    if width and image.width > width:
+                        image = image.resize((width, max(round(image.height * width / image.width / 2) * 2, 2)))
+                    temp_path = self.__temp_path(image_path)
+                    image.save(temp_path, **self.__pillow_args(image_path, options))
+                    os.replace(temp_path, image_path)
+                    generated.append(image_path)
+        except RangeUnsupported as err:
+            logger.info(f"FFmpegStrm缩略图 {host} {str(err)}，该主机使用ffmpeg命令截图")
+            with self._session_lock:
+                self._range_unsupported.add(host)
+            self._thread_state.error = str(err)
+        except Exception as err:
+            self._thread_state.error = str(err) or err.__class__.__name__
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+        return generated
+
+    @staticmethod
+    def __temp_path(image_path: str) -> str:
+        """
+        图片写入时使用的同目录临时文件，按进程和线程区分，同时生成同一文件时不会互相覆盖
+        """
+        return str(Path(image_path).with_name(f".{Path(image_path).name}.{os.getpid()}.{threading.get_ident()}.tmp"))
+
+    def __source_url(self, strm_path: str) -> str:
+        """
+        ffmpeg读取的地址，开启Range缓存时远程地址改为本地代理地址
+        """
+        target = strm_path.strip()
+        if self._range_cache and self.__get_host(target) and not self._range_cache.is_direct(target):
+            return self._range_cache.url(target)
+        return target
+
+    def __get_session(self, host: str) -> requests.Session:
+        """
+        获取主机的HTTP连接池
+        """
+        with self._session_lock:
+            session = self._sessions.get(host)
+            if not session:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._thread_count)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+            return session
+
+    def __pillow_args(self, image_path: str, options: dict) -> Dict[str, Any]:
+        """
+        PyAV后端的图片编码参数，未设置图片质量时按截图方案的qscale换算
+        """
+        if image_path.lower().endswith(".webp"):
+            return {"format": "WEBP", "quality": self._thumb_quality or 80}
+        return {"format": "JPEG", "quality": self._thumb_quality or max(105 - 5 * options["qscale"], 1)}
 
-    def execute(self, cmd: str) -> str:
+    def __encode_args(self, image_path: str, options: dict) -> List[str]:
         """
-        执行命令，获得返回结果
+        按图片扩展名选择编码器和质量参数
+        """
+        if image_path.lower().endswith(".webp"):
+            return ["-c:v", THUMB_FORMATS["webp"]["codec"], "-quality", str(self._thumb_quality or 80)]
+        if self._thumb_quality:
+            # 质量1-100换算为mjpeg的qscale 31-2
+            qscale = round(31 - (self._thumb_quality - 1) * 29 / 99)
+        else:
+            qscale = options["qscale"]
+        return ["-c:v", THUMB_FORMATS["jpg"]["codec"], "-q:v", str(qscale)]
+
+    def execute(self, cmd: List[str], timeout: float = None) -> Optional[str]:
+        """
+        执行命令，获得返回结果，失败、超时或服务停止时返回None
+        命令在独立的进程组中运行，超时或服务停止时结束整个进程组
+        """
+        timeout = timeout or self._ffmpeg_timeout
+        try:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       text=True, start_new_session=True)
+        except OSError as err:
+            logger.error(f"ffmpeg执行命令 '{shlex.join(cmd)}' 失败-error: {str(err)}")
+            self._thread_state.error = str(err)
+            return None
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=1)
+                break
+            except subprocess.TimeoutExpired:
+                if self._event.is_set():
+                    self.__kill_process(process)
+                    logger.info(f"FFmpegStrm缩略图服务停止，已结束命令 '{shlex.join(cmd)}'")
+                    self._thread_state.error = "服务停止"
+                    return None
+                if time.monotonic() >= deadline:
+                    self.__kill_process(process)
+                    logger.error(f"ffmpeg执行命令 '{shlex.join(cmd)}' 超时（{timeout}秒），已结束")
+                    self._thread_state.error = f"执行超时（{timeout}秒）"
+                    return None
+        if process.returncode != 0:
+            logger.error(f"ffmpeg执行命令 '{shlex.join(cmd)}' 失败-error: {stderr}")
+            self._thread_state.error = (stderr or "").strip() or f"退出码 {process.returncode}"
+            return None
+        output = stdout.strip() if stdout else stderr.strip()
+        # logger.info(f"ffmpeg日志: {output}")
+        return output
+
+    @staticmethod
+    def __kill_process(process: subprocess.Popen):
+        """
+        结束进程所在的进程组并回收进程
+        """
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+        try:
+            process.communicate(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+
+    def benchmark(self, path: str = None, count: int = 3, refresh: bool = False) -> Dict[str, Any]:
+        """
+        查询最近一次截图方案测速结果，refresh为true时在后台测速指定路径
+        只测试扫描路径下的文件，按主机限速和并发限制执行
+        """
+        if isinstance(refresh, str):
+            refresh = refresh.lower() in ("1", "true", "yes")
+        if not refresh:
+            result = self.get_data("benchmark")
+            if not result:
+                return {"success": False, "message": "没有测速结果，请指定path并使用refresh=true开始测速"}
+            return {"success": True, "data": result, "running": self._benchmarking}
+        target = Path(path or "")
+        if not path or not self.__in_scan_paths(target):
+            return {"success": False, "message": f"{path} 不在扫描路径中"}
+        exclude = ExcludeMatcher(self._exclude_paths.split("\n"))
+        if exclude.match(target):
+            return {"success": False, "message": f"{path} 在排除目录中"}
+        if not target.is_dir() and not (target.suffix.lower() == ".strm" and target.exists()):
+            return {"success": False, "message": f"{path} 不是strm文件或目录"}
+        try:
+            count = min(max(int(count), 1), 10)
+        except ValueError:
+            count = 3
+        with self._task_lock:
+            if self._benchmarking:
+                return {"success": False, "message": "测速正在进行中"}
+            self._benchmarking = True
+        if not self.__submit_task(self.__benchmark, target, count, exclude):
+            self._benchmarking = False
+            return {"success": False, "message": "服务已停止"}
+        return {"success": True, "message": "已开始测速，完成后重新查询"}
+
+    def __benchmark(self, target: Path, count: int, exclude: ExcludeMatcher):
+        """
+        后台测速，结果保存后通过接口查询
         """
         try:
-            result = subprocess.run(cmd, check=True, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                    text=True)
-            output = result.stdout.strip() if result.stdout else result.stderr.strip()
-            # logger.info(f"ffmpeg日志: {output}")
-            return output
-        except subprocess.CalledProcessError as err:
-            logger.error(f"ffmpeg执行命令 '{cmd}' 失败-error: {err.stderr}")
-            return ""
+            result = {"time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'), "path": str(target)}
+            files = list(islice(self.__sample_strm_files(target, exclude), count)) if target.is_dir() else [target]
+            if not files:
+                result["message"] = f"{target} 下没有strm文件"
+                self.save_data("benchmark", result)
+                return
+            profiles = {}
+            with tempfile.TemporaryDirectory() as temp_dir:
+                for key, profile in FFMPEG_PROFILES.items():
+                    timings = []
+                    for i, file_path in enumerate(files):
+                        with open(file_path, 'r', encoding='utf-8') as file:
+                            strm_path = file.read()
+                        image_path = Path(temp_dir) / f"{key}-{i}.jpg"
+                        timing = self.__timed_thumb(file_path, strm_path, str(image_path), key)
+                        if timing is None:
+                            logger.info("FFmpegStrm缩略图测速服务停止")
+                            return
+                        success, elapsed = timing
+                        timings.append({
+                            "file": str(file_path),
+                            "success": success,
+                            "seconds": round(elapsed, 3),
+                            "size": image_path.stat().st_size if success else 0,
+                        })
+                        logger.info(f"FFmpegStrm缩略图测速 {profile.get('name')}：{file_path} "
+                                    f"{'成功' if success else '失败'}，耗时{elapsed:.2f}秒")
+                    succeeded = [timing["seconds"] for timing in timings if timing["success"]]
+                    profiles[key] = {
+                        "name": profile.get("name"),
+                        "files": timings,
+                        "average": round(sum(succeeded) / len(succeeded), 3) if succeeded else None,
+                    }
+            result["profiles"] = profiles
+            self.save_data("benchmark", result)
+        except Exception as err:
+            logger.error(f"FFmpegStrm缩略图测速 {target} 时发生错误：{str(err)}")
+        finally:
+            self._benchmarking = False
+
+    def __timed_thumb(self, file_path: Path, strm_path: str, image_path: str,
+                      profile: str) -> Optional[Tuple[bool, float]]:
+        """
+        通过共用的任务队列截取一张图片，按主机限速和并发限制执行，返回是否成功和截图耗时，服务停止时返回None
+        """
+        queue = self.__get_queue()
+        if queue is None:
+            return None
+        host = self.__get_host(strm_path)
+        result = []
+        done = ThreadEvent()
+
+        def run():
+            try:
+                start = time.perf_counter()
+                success = self.get_thumb(strm_path=strm_path, image_path=image_path,
+                                         frames=self._timeline, profile=profile)
+                result.append((success, time.perf_counter() - start))
+            finally:
+                done.set()
+
+        task = partial(self.__run_on_host, host, run)
+        wait = self._limiter.reserve(host)
+        if wait > 0:
+            queue.delay(task, wait)
+        elif not queue.put(file_path, time.time(), task, self._event, boost=True):
+            return None
+        while not done.wait(1):
+            if self._event.is_set():
+                return None
+        return result[0] if result else (False, 0.0)
+
+    @staticmethod
+    def __sample_strm_files(directory: Path, exclude: ExcludeMatcher, max_dirs: int = 1000) -> Iterator[Path]:
+        """
+        测速时查找目录下的strm文件，跳过排除目录，最多遍历max_dirs个目录
+        """
+        dirs = [directory]
+        visited = 0
+        while dirs and visited < max_dirs:
+            current = dirs.pop()
+            visited += 1
+            try:
+                with os.scandir(current) as entries:
+                    entries = sorted(entries, key=lambda e: e.name)
+            except OSError:
+                continue
+            subdirs = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if not exclude.match(Path(entry.path)):
+                        subdirs.append(Path(entry.path))
+                elif entry.name.lower().endswith(".strm") and not exclude.match_file(Path(entry.path)):
+                    yield Path(entry.path)
+            dirs.extend(reversed(subdirs))
 
     def stop_service(self):
         """
         退出插件
         """
+        # 停止期间保持退出事件，所有任务都结束后再清除
+        self._event.set()
         try:
+            self.__stop_monitor()
+            with self._task_lock:
+                for timer in self._task_timers:
+                    timer.cancel()
+                self._task_timers = []
+                executor, self._task_executor = self._task_executor, None
+                queue, self._queue = self._queue, None
+                workers, self._workers = self._workers, None
+            if executor:
+                executor.shutdown(wait=True, cancel_futures=True)
+            if queue is not None:
+                queue.close()
+            if workers:
+                workers.shutdown(wait=True, cancel_futures=True)
             if self._scheduler:
                 self._scheduler.remove_all_jobs()
                 if self._scheduler.running:
-                    self._event.set()
                     self._scheduler.shutdown()
-                    self._event.clear()
                 self._scheduler = None
+            if self._concurrency:
+                self._concurrency.clear()
+            with self._inflight_lock:
+                self._inflight = set()
+                self._cache_inflight = {}
+            if self._range_cache:
+                self._range_cache.stop()
+                self._range_cache = None
+            with self._session_lock:
+                for session in self._sessions.values():
+                    session.close()
+                self._sessions = {}
+                self._range_unsupported = set()
+            if self._index:
+                self._index.close()
+                self._index = None
         except Exception as e:
             print(str(e))
+        finally:
+            self._event.clear()
 
     def post_message(self, channel: MessageChannel = None, mtype: NotificationType = None, title: str = None,
                      text: str = None, image: str = None, link: str = None, userid: str = None):